@@ -18,6 +18,7 @@ from customerService.magic_word_summary import (
 from google.cloud import firestore as gfirestore
 
 from firebase_setup import get_project_b_firestore, get_project_b_storage_bucket
+from chat_cache import update_chat
 
 
 app = Flask(
@@ -393,6 +394,7 @@ def send_message_to_user(magic_word_user_id):
         if db is None:
             return jsonify({"success": False, "error": "Firestore not initialized"}), 500
 
+        # Admin writes read the chat fresh; the chat cache is for the search functions
         chat_doc = db.collection("chats").document(chat_id).get()
         if not chat_doc.exists:
             return jsonify({"success": False, "error": "Chat not found"}), 404
@@ -440,13 +442,11 @@ def toggle_interaction(chat_id):
         data = request.get_json() or {}
         is_human = data.get("isHumanInteraction", False)
 
-        doc_ref = db.collection("chats").document(chat_id)
-        doc = doc_ref.get()
-
-        if not doc.exists:
+        if not db.collection("chats").document(chat_id).get().exists:
             return jsonify({"success": False, "error": "Chat not found"}), 404
 
-        doc_ref.update({"isHumanInteraction": is_human})
+        # Also refreshes the copy the search functions cache
+        update_chat(chat_id, {"isHumanInteraction": is_human})
 
         return jsonify({"success": True, "chatId": chat_id, "isHumanInteraction": is_human}), 200
 
@@ -586,7 +586,7 @@ def update_magic_word_status(magic_word_id):
         # ✅ NEW: Disable human interaction if completed
         if new_status == "completed" and chat_id:
              try:
-                 db.collection("chats").document(chat_id).update({"isHumanInteraction": False})
+                 update_chat(chat_id, {"isHumanInteraction": False})
                  print(f"🤖 Automation Restored: isHumanInteraction set to False for chat {chat_id}")
              except Exception as e:
                  logging.error(f"❌ Failed to disable human interaction for chat {chat_id}: {e}")
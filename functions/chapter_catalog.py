@@ -0,0 +1,270 @@
+# chapter_catalog.py
+#
+# Chapter catalog: which Pinecone indexes hold records for a chapterId, how many,
+# and which media types (text/image/audio/video) they carry.
+#
+# Firestore layout (Project B):
+#   chapterCatalog/{chapterId}
+#     - indexes: { <indexName>: {count, modalities, refreshedAt} }
+#     - modalities: {text, image, audio, video} -> bool
+#     - version, updatedAt
+#     - searchEngine: "local" | "pinecone" (optional, see local_index.py)
+#   chapterCatalog/{chapterId}/indexes/{indexName}
+#     - records: { <recordId>: <modality> }
+#
+# The CLI keeps it up to date on import/add/delete (and `catalog` builds it for
+# chapters imported before the catalog existed); the search functions read the
+# summary document through an in-process cache instead of probing Pinecone.
+# Chapters the catalog does not know yet, and indexes it records as empty, get one
+# cheap top_k=1 probe per instance and CHAPTER_CATALOG_TTL: media can reach the video
+# and audio indexes without going through the CLI, so a zero count may be stale.
+# The full listing never runs in a search request.
+import os
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+from google.cloud import firestore as gfirestore
+
+from firebase_setup import get_project_b_firestore
+from pinecone_setup import get_index
+from ttl_cache import TTLCache
+from request_timing import stage
+import resilience
+
+load_dotenv(".env.dev")
+
+CATALOG_COLLECTION = "chapterCatalog"
+
+# How long a catalog entry (or a "not in catalog" answer) is trusted in process
+CHAPTER_CATALOG_TTL = float(os.getenv("CHAPTER_CATALOG_TTL", "300"))
+
+EMBEDDING_DIM = 1536
+LIST_TOP_K = 10000  # Pinecone query limit
+MODALITIES = ("text", "image", "audio", "video")
+
+# Same URL key variants chatSuggestionData accepts
+_URL_KEYS = {
+    "video": ("videoURL", "videoUrl", "video_url"),
+    "image": ("imageURL", "imageUrl", "image_url"),
+    "audio": ("audioURL", "audioUrl", "audio_url"),
+}
+
+_NOT_IN_CATALOG = object()
+_cache = TTLCache(maxsize=2048, ttl=CHAPTER_CATALOG_TTL, name="chapter_catalog")
+# (chapterId, indexName) -> bool for chapters missing from the catalog or recorded empty
+_probes = TTLCache(maxsize=4096, ttl=CHAPTER_CATALOG_TTL, name="chapter_catalog_probes")
+
+
+def _has_value(v) -> bool:
+    if v is None:
+        return False
+    s = str(v).strip()
+    return bool(s) and s.lower() not in {"nan", "none", "null"}
+
+
+def record_modality(metadata: dict) -> str:
+    """Classify a record by the first media URL it carries (video > image > audio > text)"""
+    md = metadata or {}
+    for modality, keys in _URL_KEYS.items():
+        if any(_has_value(md.get(k)) for k in keys):
+            return modality
+    return "text"
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+
+def _summary_ref(chapter_id: str):
+    return get_project_b_firestore().collection(CATALOG_COLLECTION).document(chapter_id)
+
+
+# -------------------------
+# Read path (search functions)
+# -------------------------
+def get_chapter_entry(chapter_id: str):
+    """Return the catalog summary for a chapter, or None if it was never catalogued"""
+    cached = _cache.get(chapter_id)
+    if cached is not None:
+        return None if cached is _NOT_IN_CATALOG else cached
+
+    with stage("firestore_read"):
+        doc = _summary_ref(chapter_id).get()
+    entry = doc.to_dict() if doc.exists else None
+    _cache.set(chapter_id, entry if entry is not None else _NOT_IN_CATALOG)
+    return entry
+
+
+def chapter_index_count(chapter_id: str, index_name: str, index_host: str):
+    """Number of records `index_name` holds for `chapter_id` per the catalog, or None if unknown"""
+    entry = get_chapter_entry(chapter_id) or {}
+    info = (entry.get("indexes") or {}).get(index_name)
+    return None if info is None else int(info.get("count", 0))
+
+
+def _probe(chapter_id: str, index_name: str, index_host: str, catalogued: bool = False) -> bool:
+    """Whether Pinecone has any record of the chapter in the index (True if it cannot tell)"""
+    cached = _probes.get((chapter_id, index_name))
+    if cached is not None:
+        return cached
+
+    if not catalogued:
+        logging.info(
+            f"[chapter_catalog] {chapter_id} is not catalogued for {index_name}; "
+            f"run `exportChapterData.py catalog --chapter-id {chapter_id}`"
+        )
+    index = get_index(index_name, index_host)
+    try:
+        with stage("pinecone"):
+            resp = resilience.call(
+                "pinecone_query",
+                lambda: index.query(
+                    vector=[0.0] * EMBEDDING_DIM,
+                    top_k=1,
+                    filter={"chapterId": chapter_id},
+                    include_metadata=False,
+                ),
+            )
+    except resilience.DependencyError as e:
+        # Let the search run its own query (and its own fallback)
+        logging.warning(f"[chapter_catalog] Probe of {chapter_id}/{index_name} failed: {e}")
+        return True
+
+    found = bool(resp.get("matches"))
+    if found and catalogued:
+        logging.warning(
+            f"[chapter_catalog] Catalog records no {chapter_id} records on {index_name} but Pinecone has some; "
+            f"run `exportChapterData.py catalog --chapter-id {chapter_id}`"
+        )
+    _probes.set((chapter_id, index_name), found)
+    return found
+
+
+def chapter_has_records(chapter_id: str, index_name: str, index_host: str) -> bool:
+    count = chapter_index_count(chapter_id, index_name, index_host)
+    if count:
+        return True
+    # Unknown or zero: confirmed with the (cached) probe
+    return _probe(chapter_id, index_name, index_host, catalogued=count is not None)
+
+
+# -------------------------
+# Write path (CLI + backfill)
+# -------------------------
+def _summarize(records: dict) -> dict:
+    return {
+        "count": len(records),
+        "modalities": sorted(set(records.values())),
+        "refreshedAt": _now_iso(),
+    }
+
+
+def _write_index_records(chapter_id: str, index_name: str, update_fn) -> dict:
+    """Apply update_fn(records) -> records to one index document and refresh the summary"""
+    db = get_project_b_firestore()
+    summary_ref = _summary_ref(chapter_id)
+    index_ref = summary_ref.collection("indexes").document(index_name)
+
+    @gfirestore.transactional
+    def _apply(transaction):
+        index_doc = index_ref.get(transaction=transaction)
+        summary_doc = summary_ref.get(transaction=transaction)
+
+        records = dict((index_doc.to_dict() or {}).get("records") or {}) if index_doc.exists else {}
+        records = update_fn(records)
+
+        summary = summary_doc.to_dict() if summary_doc.exists else {}
+        indexes = dict(summary.get("indexes") or {})
+        indexes[index_name] = _summarize(records)
+
+        present = set()
+        for info in indexes.values():
+            if info.get("count", 0) > 0:
+                present.update(info.get("modalities") or [])
+
+        search_engine = summary.get("searchEngine")
+        summary = {
+            "chapterId": chapter_id,
+            "indexes": indexes,
+            "modalities": {m: m in present for m in MODALITIES},
+            "version": int(summary.get("version", 0)) + 1,
+            "updatedAt": _now_iso(),
+        }
+        if search_engine:
+            summary["searchEngine"] = search_engine
+
+        transaction.set(index_ref, {"records": records, "updatedAt": summary["updatedAt"]})
+        transaction.set(summary_ref, summary)
+        return summary
+
+    summary = _apply(db.transaction())
+    _cache.set(chapter_id, summary)
+    _probes.pop((chapter_id, index_name))
+    return summary["indexes"][index_name]
+
+
+def record_upserts(chapter_id: str, index_name: str, records: dict) -> dict:
+    """Register upserted records ({recordId: metadata}) for a chapter/index"""
+    def _update(existing):
+        for record_id, metadata in records.items():
+            existing[record_id] = record_modality(metadata)
+        return existing
+
+    return _write_index_records(chapter_id, index_name, _update)
+
+
+def record_deletes(chapter_id: str, index_name: str, record_ids) -> dict:
+    """Remove deleted record ids for a chapter/index"""
+    def _update(existing):
+        for record_id in record_ids:
+            existing.pop(record_id, None)
+        return existing
+
+    return _write_index_records(chapter_id, index_name, _update)
+
+
+def refresh_chapter_index(chapter_id: str, index_name: str, index_host: str) -> dict:
+    """Rebuild the catalog entry of one chapter/index by listing its records from Pinecone"""
+    index = get_index(index_name, index_host)
+    with stage("pinecone"):
+        resp = resilience.call("pinecone_list", lambda: index.query(
+            vector=[0.0] * EMBEDDING_DIM,
+            top_k=LIST_TOP_K,
+            filter={"chapterId": chapter_id},
+            include_metadata=True,
+        ))
+    records = {
+        m["id"]: record_modality(m.get("metadata") or {})
+        for m in resp.get("matches", [])
+    }
+    logging.info(
+        f"[chapter_catalog] Refreshed {chapter_id} on {index_name}: {len(records)} records"
+    )
+
+    try:
+        return _write_index_records(chapter_id, index_name, lambda _: records)
+    except Exception as e:
+        # Still answer from what we just listed; keep it in process until the TTL runs out
+        logging.warning(f"[chapter_catalog] Could not persist {chapter_id}/{index_name}: {e}")
+        info = _summarize(records)
+        entry = dict(get_chapter_entry(chapter_id) or {"chapterId": chapter_id})
+        entry["indexes"] = {**(entry.get("indexes") or {}), index_name: info}
+        _cache.set(chapter_id, entry)
+        return info
+
+
+def set_search_engine(chapter_id: str, engine) -> None:
+    """Pin a chapter to the "local" or "pinecone" search engine (None = use LOCAL_SEARCH_CHAPTERS)"""
+    _summary_ref(chapter_id).set({"chapterId": chapter_id, "searchEngine": engine}, merge=True)
+    _cache.pop(chapter_id)
+
+
+def chapter_id_from_record_id(record_id: str):
+    """Record ids are written as '<chapterId>::<suffix>' by the CLI"""
+    if record_id and "::" in record_id:
+        return record_id.split("::", 1)[0]
+    return None
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,175 @@
+# chapter_snapshot.py
+#
+# On-disk snapshot of one chapter's records in one index, so a fresh instance can
+# serve local_index queries without listing the chapter from Pinecone.
+#
+#   <dir>/<indexName>/<chapterId>.vec         unit-normalized vectors, row-major float32 or float16
+#   <dir>/<indexName>/<chapterId>.ids.json    id index + header (dtype, count, dim, catalogVersion,
+#                                             byte offsets of each row's metadata line)
+#   <dir>/<indexName>/<chapterId>.meta.jsonl  one metadata object per row, same order as .vec
+#
+# The vector file is opened with numpy.memmap and the metadata sidecar with mmap;
+# only the rows a query returns are decoded. Snapshots are written by
+# `exportChapterData.py snapshot` into functions/snapshots (shipped with the source)
+# and can also be uploaded to the Project B bucket under CHAPTER_SNAPSHOT_PREFIX.
+import os
+import json
+import mmap
+import logging
+from urllib.parse import quote
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_DTYPES = ("float32", "float16")
+
+CHAPTER_SNAPSHOT_DIR = os.getenv(
+    "CHAPTER_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+)
+# Set to 1 to fall back to Cloud Storage when a snapshot is not shipped with the source
+CHAPTER_SNAPSHOT_FROM_STORAGE = os.getenv("CHAPTER_SNAPSHOT_FROM_STORAGE", "0") == "1"
+CHAPTER_SNAPSHOT_PREFIX = os.getenv("CHAPTER_SNAPSHOT_PREFIX", "chapterSnapshots")
+# Where downloaded snapshots are kept (the source directory is read-only when deployed)
+CHAPTER_SNAPSHOT_CACHE_DIR = os.getenv("CHAPTER_SNAPSHOT_CACHE_DIR", "/tmp/chapterSnapshots")
+
+_SUFFIXES = (".vec", ".ids.json", ".meta.jsonl")
+
+
+class SnapshotMetadata:
+    """Row -> metadata dict, decoded on access from the memory-mapped .meta.jsonl sidecar"""
+
+    def __init__(self, path: str, offsets: list):
+        self._offsets = offsets
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1 if self._offsets else 0
+
+    def __getitem__(self, row: int) -> dict:
+        return json.loads(self._data[self._offsets[row]:self._offsets[row + 1]])
+
+
+class Snapshot:
+    def __init__(self, header: dict, vectors: np.ndarray, metadata: SnapshotMetadata):
+        self.header = header
+        self.ids = header["ids"]
+        self.vectors = vectors
+        self.metadata = metadata
+
+    @property
+    def catalog_version(self):
+        return self.header.get("catalogVersion")
+
+
+def _paths(directory: str, index_name: str, chapter_id: str) -> list:
+    base = os.path.join(directory, index_name, quote(chapter_id, safe=""))
+    return [base + suffix for suffix in _SUFFIXES]
+
+
+def write_snapshot(index_name: str, chapter_id: str, records: list, dtype: str = "float32",
+                   catalog_version=None, directory: str = None) -> list:
+    """
+    Write a snapshot from Pinecone matches ({id, values, metadata}); returns the file paths.
+    Vectors are unit-normalized before they are stored.
+    """
+    if dtype not in SNAPSHOT_DTYPES:
+        raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+
+    vec_path, ids_path, meta_path = _paths(directory or CHAPTER_SNAPSHOT_DIR, index_name, chapter_id)
+    os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+
+    if records:
+        vectors = np.array([r["values"] for r in records], dtype=np.float32).reshape(len(records), -1)
+    else:
+        # A chapter with nothing in this index still gets a (0, 0) snapshot
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    (vectors / norms).astype(dtype).tofile(vec_path)
+
+    offsets = [0]
+    with open(meta_path, "wb") as f:
+        for r in records:
+            line = json.dumps(r.get("metadata") or {}, ensure_ascii=False, separators=(",", ":")) + "\n"
+            offsets.append(offsets[-1] + f.write(line.encode("utf-8")))
+
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "indexName": index_name,
+        "chapterId": chapter_id,
+        "catalogVersion": catalog_version,
+        "dtype": dtype,
+        "count": len(records),
+        "dim": int(vectors.shape[1]),
+        "ids": [r["id"] for r in records],
+        "metaOffsets": offsets,
+    }
+    with open(ids_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+
+    return [vec_path, ids_path, meta_path]
+
+
+def upload_snapshot(index_name: str, chapter_id: str, directory: str = None) -> list:
+    """Copy a written snapshot to the Project B bucket; returns the blob names"""
+    from firebase_setup import get_project_b_storage_bucket
+
+    bucket = get_project_b_storage_bucket()
+    names = []
+    for path in _paths(directory or CHAPTER_SNAPSHOT_DIR, index_name, chapter_id):
+        name = f"{CHAPTER_SNAPSHOT_PREFIX}/{index_name}/{os.path.basename(path)}"
+        bucket.blob(name).upload_from_filename(path)
+        names.append(name)
+    return names
+
+
+def _download(index_name: str, chapter_id: str) -> bool:
+    from firebase_setup import get_project_b_storage_bucket
+
+    bucket = get_project_b_storage_bucket()
+    paths = _paths(CHAPTER_SNAPSHOT_CACHE_DIR, index_name, chapter_id)
+    os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+    for path in paths:
+        blob = bucket.blob(f"{CHAPTER_SNAPSHOT_PREFIX}/{index_name}/{os.path.basename(path)}")
+        if not blob.exists():
+            return False
+        blob.download_to_filename(path)
+    return True
+
+
+def _find(index_name: str, chapter_id: str):
+    """Directory holding a complete snapshot for the chapter/index, or None"""
+    for directory in (CHAPTER_SNAPSHOT_DIR, CHAPTER_SNAPSHOT_CACHE_DIR):
+        if all(os.path.exists(p) for p in _paths(directory, index_name, chapter_id)):
+            return directory
+    return None
+
+
+def open_snapshot(index_name: str, chapter_id: str):
+    """Memory-map a chapter snapshot, downloading it first if allowed; None if there is none"""
+    directory = _find(index_name, chapter_id)
+    if directory is None and CHAPTER_SNAPSHOT_FROM_STORAGE:
+        try:
+            if _download(index_name, chapter_id):
+                directory = CHAPTER_SNAPSHOT_CACHE_DIR
+        except Exception as e:
+            logging.warning(f"[chapter_snapshot] Download of {index_name}/{chapter_id} failed: {e}")
+    if directory is None:
+        return None
+
+    vec_path, ids_path, meta_path = _paths(directory, index_name, chapter_id)
+    with open(ids_path, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != SNAPSHOT_FORMAT:
+        logging.warning(f"[chapter_snapshot] Unknown snapshot format in {ids_path}")
+        return None
+
+    count, dim = header["count"], header["dim"]
+    if count:
+        vectors = np.memmap(vec_path, dtype=header["dtype"], mode="r", shape=(count, dim))
+    else:
+        vectors = np.zeros((0, dim), dtype=header["dtype"])
+    return Snapshot(header, vectors, SnapshotMetadata(meta_path, header["metaOffsets"] if count else []))
@@ -4,10 +4,18 @@ from datetime import datetime
 import logging
 import os
 import json
-from openai import OpenAI
-from pinecone import Pinecone
 from dotenv import load_dotenv
 from firebase_setup import get_project_b_firestore
+from openai_setup import client
+from chapter_catalog import chapter_has_records, get_chapter_entry
+from embedding_cache import get_embedding, normalize_text
+import semantic_cache
+import singleflight
+import local_index
+from record_metadata import query_matches
+from message_writer import write_messages
+from request_timing import timed_request
+from resilience import DependencyError
 
 # Load environment variables
 load_dotenv(".env.dev")
@@ -15,10 +23,6 @@ load_dotenv(".env.dev")
 # Firestore (Project B)
 project_b_db = get_project_b_firestore()
 
-# OpenAI & Pinecone
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-
 # List all your index names and hosts
 INDEXES = [
     {"name": os.getenv("KABIR_INDEX_NAME"),       "host": os.getenv("KABIR_INDEX_HOST")},
@@ -34,7 +38,43 @@ TYPE_QUOTAS = {"text": 2, "image": 1, "video": 1, "audio": 1}
 FALLBACK_FILL = True
 TOP_K_PER_INDEX = 10  # pull more so quotas can be satisfied
 
+def search_indexes(chapterId: str, content: str) -> dict:
+    """{indexName: matches} for the query across INDEXES"""
+    # Get embedding for the query (same model as the upserts; served from cache on repeats)
+    query_vector = get_embedding(content, client)
+
+    # A paraphrase of a recent query for this chapter reuses its matches
+    # instead of querying Pinecone again (unless the chapter was re-exported since)
+    version = (get_chapter_entry(chapterId) or {}).get("version")
+    index_matches = semantic_cache.lookup("chatSuggestionData", chapterId, query_vector, version)
+    if index_matches is not None:
+        return index_matches
+
+    index_matches = {}
+    for idx in INDEXES:
+        if not idx["name"] or not idx["host"]:
+            continue
+
+        # Skip indexes the chapter catalog says hold nothing for this chapter
+        if not chapter_has_records(chapterId, idx["name"], idx["host"]):
+            continue
+
+        # Chapters switched to the local engine are searched in process
+        matches = local_index.query(idx["name"], idx["host"], chapterId, query_vector, TOP_K_PER_INDEX)
+        if matches is None:
+            # Only candidates above SCORE_THRESHOLD get their metadata loaded
+            matches = query_matches(
+                idx["name"], idx["host"], query_vector, TOP_K_PER_INDEX,
+                filter={"chapterId": {"$eq": chapterId}},
+                min_score=SCORE_THRESHOLD,
+            )
+        index_matches[idx["name"]] = matches
+
+    semantic_cache.store("chatSuggestionData", chapterId, query_vector, index_matches, version)
+    return index_matches
+
 @https_fn.on_request()
+@timed_request("chatSuggestionData")
 def chatSuggestionData(req: Request) -> https_fn.Response:
     try:
         data = req.get_json(silent=True) or {}
@@ -47,13 +87,6 @@ def chatSuggestionData(req: Request) -> https_fn.Response:
         if not all([chapterId, chatId, content, location]):
             return https_fn.Response("Missing required parameters", status=400)
 
-        # Get embedding for the query
-        embedding_response = client.embeddings.create(
-            model="text-embedding-ada-002",  # match your upsert model
-            input=content
-        )
-        query_vector = embedding_response.data[0].embedding
-
         print(f"Searching for chapterId: {chapterId} with content: {content}")
         print(f"Using indexes: {INDEXES}")
 
@@ -62,22 +95,19 @@ def chatSuggestionData(req: Request) -> https_fn.Response:
         all_items = []
         seen = set()
 
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-
-        # Query each index
-        for idx in INDEXES:
-            if not idx["name"] or not idx["host"]:
-                continue
-
-            index = pc.Index(name=idx["name"], host=idx["host"])
-            search_response = index.query(
-                vector=query_vector,
-                top_k=TOP_K_PER_INDEX,
-                filter={"chapterId": {"$eq": chapterId}},
-                include_metadata=True
+        # Raw matches per index; identical concurrent requests for this chapter
+        # share one embedding + query
+        try:
+            index_matches = singleflight.do(
+                ("chatSuggestionData", chapterId, normalize_text(content)),
+                lambda: search_indexes(chapterId, content),
             )
+        except DependencyError as e:
+            # OpenAI / Pinecone too slow or unhealthy: answer right away with no suggestions
+            logging.error(f"chatSuggestionData falling back: {e}")
+            index_matches = {}
 
-            matches = search_response.get("matches", [])
+        for matches in index_matches.values():
             for match in matches:
                 if match.get("score", 0) < SCORE_THRESHOLD:
                     continue
@@ -161,19 +191,17 @@ def chatSuggestionData(req: Request) -> https_fn.Response:
 
         # Write each to Firestore
         col_ref = project_b_db.collection("chatRecomendation")
-        batch = project_b_db.batch()
-        written_refs = []
+        writes = []
         for item in results:
             doc_ref = col_ref.document()
             item["docId"] = doc_ref.id 
-            batch.set(doc_ref, item)
-            written_refs.append(doc_ref)
-        batch.commit()
+            writes.append((doc_ref, item))
+        write_messages(project_b_db, writes)
 
         return https_fn.Response(
             json.dumps({
                 "message": "Chat recommendations inserted",
-                "count": len(written_refs),
+                "count": len(writes),
                 "data": results
             }),
             status=200,
@@ -0,0 +1,72 @@
+# chat_cache.py
+#
+# Bounded in-process cache of chats/{chatId} in Project B: whether the chat exists
+# plus the core fields the search functions read, so a chat costs one Firestore read
+# per CHAT_CACHE_TTL instead of one per request. The admin app reads chats directly
+# and writes through update_chat(), which refreshes the cached entry.
+import os
+from dotenv import load_dotenv
+
+from firebase_setup import get_project_b_firestore
+from ttl_cache import TTLCache
+from request_timing import stage, register_stats
+
+load_dotenv(".env.dev")
+
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "60"))
+# Unknown chat ids are remembered briefly so a just-created chat is picked up quickly
+CHAT_CACHE_MISS_TTL = float(os.getenv("CHAT_CACHE_MISS_TTL", "5"))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "10000"))
+
+# Fields kept per chat (the rest of the document is not cached)
+CHAT_FIELDS = ("chat_type", "participants", "location", "chapterId", "isHumanInteraction")
+
+_NO_CHAT = object()
+_cache = TTLCache(maxsize=CHAT_CACHE_MAX_ENTRIES, ttl=CHAT_CACHE_TTL, name="chat_cache")
+
+
+def _chat_ref(chat_id: str):
+    return get_project_b_firestore().collection("chats").document(chat_id)
+
+
+def get_chat(chat_id: str):
+    """Core fields of a chat (dict), or None if the chat does not exist"""
+    cached = _cache.get(chat_id)
+    if cached is not None:
+        return None if cached is _NO_CHAT else cached
+
+    with stage("firestore_read"):
+        doc = _chat_ref(chat_id).get()
+    if not doc.exists:
+        _cache.set(chat_id, _NO_CHAT, ttl=CHAT_CACHE_MISS_TTL)
+        return None
+
+    data = doc.to_dict() or {}
+    chat = {k: data[k] for k in CHAT_FIELDS if k in data}
+    _cache.set(chat_id, chat)
+    return chat
+
+
+def chat_exists(chat_id: str) -> bool:
+    return get_chat(chat_id) is not None
+
+
+def update_chat(chat_id: str, fields: dict) -> None:
+    """Update a chat document and the cached copy of its core fields"""
+    _chat_ref(chat_id).update(fields)
+    cached = _cache.get(chat_id)
+    if cached is not None and cached is not _NO_CHAT:
+        _cache.set(chat_id, {**cached, **{k: v for k, v in fields.items() if k in CHAT_FIELDS}})
+    else:
+        _cache.pop(chat_id)
+
+
+def invalidate_chat(chat_id: str) -> None:
+    _cache.pop(chat_id)
+
+
+def chat_cache_stats() -> dict:
+    return _cache.stats()
+
+
+register_stats("chat_cache", chat_cache_stats)
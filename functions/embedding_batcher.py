@@ -0,0 +1,99 @@
+# embedding_batcher.py
+#
+# Coalesces the single-text embedding calls of concurrent requests on one instance.
+# The first caller opens a batch and waits up to EMBED_BATCH_MAX_WAIT_MS for other
+# callers to join (or for EMBED_BATCH_MAX_SIZE texts), then sends all of them in one
+# list-input embeddings.create call and hands every caller its own vector. A lone
+# request pays at most the wait; under load N requests cost one API call instead of N.
+import os
+import time
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+
+import resilience
+from request_timing import register_stats
+
+load_dotenv(".env.dev")
+
+# 0 sends every text on its own, as before
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+
+_cond = threading.Condition()
+_open = {}  # (client id, model) -> batch still accepting texts
+_stats = {"texts": 0, "calls": 0, "largest_batch": 0}
+
+
+class _Batch:
+    def __init__(self):
+        self.texts = {}  # text -> Future (identical texts share one input)
+
+    def add(self, text: str) -> Future:
+        future = self.texts.get(text)
+        if future is None:
+            future = self.texts[text] = Future()
+        return future
+
+
+def _send(batch: _Batch, client, model: str) -> None:
+    texts = list(batch.texts)
+    with _cond:
+        _stats["calls"] += 1
+        _stats["largest_batch"] = max(_stats["largest_batch"], len(texts))
+    try:
+        response = resilience.call("openai_embed", lambda: client.embeddings.create(model=model, input=texts))
+    except Exception as e:
+        for future in batch.texts.values():
+            future.set_exception(e)
+        return
+    for item in response.data:
+        batch.texts[texts[item.index]].set_result(item.embedding)
+    for future in batch.texts.values():
+        if not future.done():
+            future.set_exception(RuntimeError("Embedding missing from the batch response"))
+
+
+def embed(text: str, client, model: str) -> list:
+    """Embedding of one text, sent together with the texts other threads ask for meanwhile"""
+    if EMBED_BATCH_MAX_WAIT_MS <= 0 or EMBED_BATCH_MAX_SIZE <= 1:
+        with _cond:
+            _stats["texts"] += 1
+            _stats["calls"] += 1
+        response = resilience.call("openai_embed", lambda: client.embeddings.create(model=model, input=text))
+        return response.data[0].embedding
+
+    key = (id(client), model)
+    with _cond:
+        _stats["texts"] += 1
+        batch = _open.get(key)
+        leader = batch is None
+        if leader:
+            batch = _open[key] = _Batch()
+        future = batch.add(text)
+        if len(batch.texts) >= EMBED_BATCH_MAX_SIZE:
+            _open.pop(key)
+            _cond.notify_all()
+
+        if leader:
+            deadline = time.monotonic() + EMBED_BATCH_MAX_WAIT_MS / 1000
+            while _open.get(key) is batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    _open.pop(key)
+                    break
+                _cond.wait(remaining)
+
+    if leader:
+        _send(batch, client, model)
+    # Callers that asked for the same text each get their own copy
+    return list(future.result())
+
+
+def batcher_stats() -> dict:
+    with _cond:
+        calls = _stats["calls"]
+        return {**_stats, "texts_per_call": round(_stats["texts"] / calls, 2) if calls else 0.0}
+
+
+register_stats("embedding_batcher", batcher_stats)
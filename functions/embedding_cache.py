@@ -0,0 +1,131 @@
+# embedding_cache.py
+#
+# One in-process cache for query embeddings, shared by every module that embeds text.
+# Keys are (model, normalized text); vectors are stored as float32 arrays so a
+# 1536-dim embedding costs ~6 KB instead of ~50 KB as a list of Python floats.
+# Misses read through the cross-instance Firestore tier (embedding_store) before OpenAI;
+# single-text OpenAI calls of concurrent requests are coalesced by embedding_batcher.
+# Hit/miss counters of both tiers are logged with the instance stats (request_timing).
+import os
+from array import array
+from dotenv import load_dotenv
+
+from ttl_cache import TTLCache
+from embedding_store import load_embedding, load_embeddings, save_embedding, store_stats
+from request_timing import stage, register_stats
+from embedding_batcher import embed
+import singleflight
+import resilience
+
+load_dotenv(".env.dev")
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Total bytes of vectors kept in process (default 32 MB ≈ 5k ada-002 embeddings)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", str(24 * 3600)))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+# OpenAI accepts at most 2048 inputs per embeddings request
+MAX_INPUTS_PER_REQUEST = 2048
+
+
+def _vector_bytes(vector: array) -> int:
+    return vector.itemsize * len(vector) + 64
+
+
+_cache = TTLCache(
+    maxsize=EMBEDDING_CACHE_MAX_ENTRIES,
+    ttl=EMBEDDING_CACHE_TTL,
+    name="embedding_cache",
+    max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+    sizeof=_vector_bytes,
+)
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold and collapse whitespace so trivially different phrasings share a key"""
+    return " ".join(str(text or "").casefold().split())
+
+
+def cache_key(text: str, model: str = EMBEDDING_MODEL):
+    return (model, normalize_text(text))
+
+
+def get_embedding(text: str, client, model: str = EMBEDDING_MODEL, use_store: bool = True) -> list:
+    """
+    Return the embedding for `text`, calling OpenAI only when both cache tiers miss.
+    use_store=False skips the shared Firestore tier (document ingestion, not queries).
+    """
+    key = cache_key(text, model)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached.tolist()
+
+    # Concurrent misses for the same text share one store read / OpenAI call
+    return list(singleflight.do(("embed",) + key, lambda: _load_or_embed(key, text, client, model, use_store)))
+
+
+def _load_or_embed(key, text: str, client, model: str, use_store: bool) -> list:
+    stored = load_embedding(model, key[1]) if use_store else None
+    if stored is not None:
+        _cache.set(key, stored)
+        return stored.tolist()
+
+    with stage("embed"):
+        vector = embed(text, client, model)
+    _cache.set(key, array("f", vector))
+    if use_store:
+        save_embedding(model, key[1], vector)
+    return vector
+
+
+def get_embeddings(texts: list, client, model: str = EMBEDDING_MODEL) -> list:
+    """
+    Embeddings for a list of texts, in input order. Cached texts are served from
+    the cache tiers; all remaining ones go to OpenAI in a single list-input call.
+    """
+    keys = [cache_key(t, model) for t in texts]
+    vectors = {}
+
+    for key in keys:
+        if key not in vectors:
+            cached = _cache.get(key)
+            if cached is not None:
+                vectors[key] = cached
+
+    missing = [k for k in dict.fromkeys(keys) if k not in vectors]
+    if missing:
+        stored = load_embeddings(model, [k[1] for k in missing])
+        for key in missing:
+            if key[1] in stored:
+                vectors[key] = stored[key[1]]
+                _cache.set(key, stored[key[1]])
+
+    missing = [k for k in missing if k not in vectors]
+    if missing:
+        # Embed one representative text per key (the first original spelling)
+        originals = {}
+        for text, key in zip(texts, keys):
+            originals.setdefault(key, text)
+
+        for start in range(0, len(missing), MAX_INPUTS_PER_REQUEST):
+            chunk = missing[start:start + MAX_INPUTS_PER_REQUEST]
+            with stage("embed"):
+                response = resilience.call(
+                    "openai_embed", lambda: client.embeddings.create(model=model, input=[originals[k] for k in chunk])
+                )
+            for item in sorted(response.data, key=lambda d: d.index):
+                key = chunk[item.index]
+                vectors[key] = array("f", item.embedding)
+                _cache.set(key, vectors[key])
+                save_embedding(model, key[1], item.embedding)
+
+    return [vectors[key].tolist() for key in keys]
+
+
+def cache_stats() -> dict:
+    return {**_cache.stats(), "store": store_stats()}
+
+
+register_stats("embedding_cache", cache_stats)
@@ -0,0 +1,231 @@
+# embedding_store.py
+#
+# Second embedding-cache tier shared by every instance: query embeddings persisted
+# in Project B Firestore, one document per sha256(model + normalized text).
+#
+#   embeddingCache/{hash}
+#     - model, text, dim
+#     - vector: little-endian float32 bytes (6 KB for ada-002, not a 1536-element list)
+#     - createdAt, lastUsedAt
+#
+# Entries expire EMBEDDING_STORE_MAX_AGE_DAYS after they were last used, on read as
+# well as in prune_embedding_store().
+#
+# Reads go through before OpenAI is called (see embedding_cache.get_embedding);
+# writes happen in the background so a miss never waits on a Firestore commit.
+import os
+import sys
+import hashlib
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from firebase_setup import get_project_b_firestore
+from request_timing import stage
+
+load_dotenv(".env.dev")
+
+EMBEDDING_STORE_COLLECTION = "embeddingCache"
+EMBEDDING_STORE_ENABLED = os.getenv("EMBEDDING_STORE_ENABLED", "1") == "1"
+
+# Age / size eviction
+EMBEDDING_STORE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_STORE_MAX_AGE_DAYS", "30"))
+EMBEDDING_STORE_MAX_DOCS = int(os.getenv("EMBEDDING_STORE_MAX_DOCS", "50000"))
+# Each instance runs a background prune after this many saves
+EMBEDDING_STORE_PRUNE_EVERY = int(os.getenv("EMBEDDING_STORE_PRUNE_EVERY", "500"))
+# lastUsedAt is refreshed at most this often per document (avoids a write per hit)
+EMBEDDING_STORE_TOUCH_HOURS = 24
+
+_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="embedding-store")
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "errors": 0}
+_saves_since_prune = 0
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec="milliseconds") + "Z"
+
+
+def _parse_iso(value: str):
+    try:
+        return datetime.fromisoformat(str(value).rstrip("Z"))
+    except ValueError:
+        return None
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def content_hash(model: str, normalized_text: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalized_text}".encode("utf-8")).hexdigest()
+
+
+def encode_vector(vector) -> bytes:
+    packed = array("f", vector)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def decode_vector(blob: bytes) -> array:
+    packed = array("f")
+    packed.frombytes(bytes(blob))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed
+
+
+def _collection():
+    return get_project_b_firestore().collection(EMBEDDING_STORE_COLLECTION)
+
+
+def _vector_from_doc(doc):
+    """Decode a stored embedding document, expiring/touching it as needed"""
+    if not doc.exists:
+        _count("misses")
+        return None
+
+    data = doc.to_dict() or {}
+    now = _now()
+    # Same clock as the prune: age since last use
+    last_used = _parse_iso(data.get("lastUsedAt", "")) or _parse_iso(data.get("createdAt", ""))
+    if last_used is None or now - last_used > timedelta(days=EMBEDDING_STORE_MAX_AGE_DAYS):
+        _count("expired")
+        _writer.submit(doc.reference.delete)
+        return None
+
+    vector = decode_vector(data.get("vector") or b"")
+    if len(vector) != data.get("dim"):
+        _count("misses")
+        return None
+
+    if now - last_used > timedelta(hours=EMBEDDING_STORE_TOUCH_HOURS):
+        _writer.submit(doc.reference.update, {"lastUsedAt": _iso(now)})
+
+    _count("hits")
+    return vector
+
+
+def load_embedding(model: str, normalized_text: str):
+    """Return the stored float32 vector for (model, text), or None on a miss / expired entry"""
+    if not EMBEDDING_STORE_ENABLED:
+        return None
+
+    try:
+        with stage("firestore_read"):
+            doc = _collection().document(content_hash(model, normalized_text)).get()
+        return _vector_from_doc(doc)
+    except Exception as e:
+        _count("errors")
+        logging.warning(f"[embedding_store] Read failed: {e}")
+        return None
+
+
+def load_embeddings(model: str, normalized_texts: list) -> dict:
+    """Batch read: {normalized_text: vector} for every text found, in one Firestore round trip"""
+    if not EMBEDDING_STORE_ENABLED or not normalized_texts:
+        return {}
+
+    try:
+        col = _collection()
+        by_hash = {content_hash(model, t): t for t in normalized_texts}
+        with stage("firestore_read"):
+            docs = list(get_project_b_firestore().get_all([col.document(h) for h in by_hash]))
+        found = {}
+        for doc in docs:
+            vector = _vector_from_doc(doc)
+            if vector is not None:
+                found[by_hash[doc.id]] = vector
+        return found
+    except Exception as e:
+        _count("errors")
+        logging.warning(f"[embedding_store] Batch read failed: {e}")
+        return {}
+
+
+def _write(model: str, normalized_text: str, blob: bytes, dim: int) -> None:
+    global _saves_since_prune
+    try:
+        now = _iso(_now())
+        _collection().document(content_hash(model, normalized_text)).set({
+            "model": model,
+            "text": normalized_text[:500],
+            "dim": dim,
+            "vector": blob,
+            "createdAt": now,
+            "lastUsedAt": now,
+        })
+        _count("writes")
+    except Exception as e:
+        _count("errors")
+        logging.warning(f"[embedding_store] Write failed: {e}")
+        return
+
+    with _lock:
+        _saves_since_prune += 1
+        run_prune = _saves_since_prune >= EMBEDDING_STORE_PRUNE_EVERY
+        if run_prune:
+            _saves_since_prune = 0
+    if run_prune:
+        try:
+            prune_embedding_store()
+        except Exception as e:
+            logging.warning(f"[embedding_store] Prune failed: {e}")
+
+
+def save_embedding(model: str, normalized_text: str, vector) -> None:
+    """Persist a vector in the background"""
+    if not EMBEDDING_STORE_ENABLED:
+        return
+    _writer.submit(_write, model, normalized_text, encode_vector(vector), len(vector))
+
+
+def prune_embedding_store(max_docs: int = None, max_age_days: float = None) -> int:
+    """Delete entries unused for max_age_days, then the least recently used beyond max_docs"""
+    max_docs = EMBEDDING_STORE_MAX_DOCS if max_docs is None else max_docs
+    max_age_days = EMBEDDING_STORE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    db = get_project_b_firestore()
+    col = _collection()
+    deleted = 0
+
+    def _delete(docs):
+        nonlocal deleted
+        batch = db.batch()
+        for d in docs:
+            batch.delete(d.reference)
+        batch.commit()
+        deleted += len(docs)
+
+    cutoff = _iso(_now() - timedelta(days=max_age_days))
+    while True:
+        stale = list(col.where("lastUsedAt", "<", cutoff).limit(500).stream())
+        if not stale:
+            break
+        _delete(stale)
+
+    total = col.count().get()[0][0].value
+    overflow = total - max_docs
+    while overflow > 0:
+        oldest = list(col.order_by("lastUsedAt").limit(min(overflow, 500)).stream())
+        if not oldest:
+            break
+        _delete(oldest)
+        overflow -= len(oldest)
+
+    logging.info(f"[embedding_store] Pruned {deleted} embeddings")
+    return deleted
+
+
+def store_stats() -> dict:
+    with _lock:
+        return dict(_stats)
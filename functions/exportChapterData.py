@@ -4,17 +4,46 @@ import json
 import argparse
 import pandas as pd
 from dotenv import load_dotenv
-from pinecone import Pinecone
-from openai import OpenAI
 
 # Load .env.dev from the same directory as this script
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(script_dir, ".env.dev")
 load_dotenv(env_path)
 
+from pinecone_setup import get_index
+from chapter_catalog import (
+    record_upserts,
+    record_deletes,
+    refresh_chapter_index,
+    chapter_id_from_record_id,
+    set_search_engine,
+    get_chapter_entry,
+)
+import local_index
+from chapter_snapshot import write_snapshot, upload_snapshot, SNAPSHOT_DTYPES
+from embedding_cache import get_embedding
+from embedding_store import prune_embedding_store
+from record_metadata import save_metadata, delete_metadata
+
 def zero_vector(dim: int):
     return [0.0] * dim
 
+def sync_catalog(update, *args):
+    """Keep the chapter catalog in step with Pinecone (never fails the command)"""
+    try:
+        info = update(*args)
+        print(f"📚 Chapter catalog updated: {info['count']} records, modalities={info['modalities']}")
+    except Exception as e:
+        print(f"⚠️ Could not update chapter catalog: {e}")
+
+def sync_metadata(update, *args):
+    """Keep the record metadata side-store in step with Pinecone (never fails the command)"""
+    try:
+        count = update(*args)
+        print(f"🗂️ Metadata side-store updated: {count} records")
+    except Exception as e:
+        print(f"⚠️ Could not update metadata side-store: {e}")
+
 def flatten_match(m: dict) -> dict:
     md = m.get("metadata") or {}
     return {
@@ -36,8 +65,7 @@ def export_chapter_data(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("Missing Pinecone environment variables.")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"🔍 Fetching records for chapterId='{args.chapter_id}'...")
 
@@ -61,20 +89,20 @@ def export_chapter_data(args):
     print(f"   - {csv_name}")
     print(f"   - {xlsx_name}")
 
-def generate_embedding(text: str) -> list:
-    """Generate embedding using OpenAI"""
+def generate_embedding(text: str, use_store: bool = False) -> list:
+    """Generate embedding using OpenAI (use_store: also use the shared query-embedding store)"""
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     if not OPENAI_API_KEY:
         print("⚠️ Warning: Missing OPENAI_API_KEY, using zero vector")
         return [0.0] * 1536
     
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        embedding = response.data[0].embedding
+        # Only built once the key is known to be set; commands that never embed
+        # (catalog, snapshot, delete, list, ...) run without it
+        from openai_setup import client
+
+        # Document text is kept out of the shared query-embedding store
+        embedding = get_embedding(text, client, use_store=use_store)
         print(f"   ✅ Generated embedding with {len(embedding)} dimensions")
         return embedding
     except Exception as e:
@@ -116,14 +144,14 @@ def import_from_excel(args):
     if text_column is None:
         raise SystemExit(f"❌ Excel file must have a 'text' or 'Text' column. Found columns: {list(df.columns)}")
     
-    # Initialize Pinecone
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    # Shared Pinecone index handle
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
     
     print(f"📊 Found {len(df)} rows to import")
     print(f"🎯 Target Chapter ID: {args.chapter_id}")
     
     vectors_to_upsert = []
+    upserted = {}
     success_count = 0
     error_count = 0
     
@@ -167,6 +195,7 @@ def import_from_excel(args):
             "values": embedding,
             "metadata": metadata
         })
+        upserted[record_id] = metadata
         
         success_count += 1
         
@@ -181,6 +210,10 @@ def import_from_excel(args):
         index.upsert(vectors=vectors_to_upsert)
         print(f"✅ Uploaded final batch of {len(vectors_to_upsert)} records")
     
+    if upserted:
+        sync_catalog(record_upserts, args.chapter_id, PINECONE_INDEX_NAME, upserted)
+        sync_metadata(save_metadata, PINECONE_INDEX_NAME, upserted)
+    
     print(f"\n🎉 Import complete!")
     print(f"   ✅ Success: {success_count} records")
     print(f"   ❌ Errors: {error_count} records")
@@ -196,8 +229,7 @@ def delete_record(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("Missing Pinecone environment variables.")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"🗑️ Deleting record with ID='{args.record_id}'...")
     
@@ -207,6 +239,14 @@ def delete_record(args):
         print(f"✅ Successfully deleted record: {args.record_id}")
     except Exception as e:
         print(f"❌ Error deleting record: {e}")
+        return
+
+    sync_metadata(delete_metadata, PINECONE_INDEX_NAME, [args.record_id])
+    chapter_id = chapter_id_from_record_id(args.record_id)
+    if chapter_id:
+        sync_catalog(record_deletes, chapter_id, PINECONE_INDEX_NAME, [args.record_id])
+    else:
+        print("⚠️ Record ID has no '<chapterId>::' prefix; chapter catalog not updated")
 
 def delete_all_records(args):
     """Delete all records for a chapter"""
@@ -217,8 +257,7 @@ def delete_all_records(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("Missing Pinecone environment variables.")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"🔍 Finding all records for chapterId='{args.chapter_id}'...")
     
@@ -262,6 +301,10 @@ def delete_all_records(args):
         print(f"❌ Error deleting records: {e}")
         print(f"   Deleted {total_deleted} out of {len(record_ids)} records before error")
 
+    if total_deleted:
+        sync_catalog(record_deletes, args.chapter_id, PINECONE_INDEX_NAME, record_ids[:total_deleted])
+        sync_metadata(delete_metadata, PINECONE_INDEX_NAME, record_ids[:total_deleted])
+
 def list_records(args):
     """List all records for a chapter with their IDs"""
     PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
@@ -271,8 +314,7 @@ def list_records(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("Missing Pinecone environment variables.")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"📋 Listing records for chapterId='{args.chapter_id}'...")
 
@@ -307,26 +349,35 @@ def search_records(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("Missing Pinecone environment variables.")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"🔍 Searching for: '{args.query}'")
     
     # Generate embedding for the search query
-    query_embedding = generate_embedding(args.query)
+    query_embedding = generate_embedding(args.query, use_store=True)
     
     if query_embedding is None:
         raise SystemExit("❌ Failed to generate embedding for query")
     
-    # Perform semantic search
-    resp = index.query(
-        vector=query_embedding,
-        top_k=args.top_k,
-        include_metadata=True,
-        filter={"chapterId": args.chapter_id} if args.chapter_id else None,
-    )
-    
-    matches = resp.get("matches", [])
+    # Perform semantic search (chapters on the local engine are searched in process)
+    matches = None
+    if args.chapter_id and args.engine != "pinecone":
+        engine = "local" if args.engine == "local" else None
+        matches = local_index.query(
+            PINECONE_INDEX_NAME, PINECONE_INDEX_HOST, args.chapter_id,
+            query_embedding, args.top_k, engine=engine,
+        )
+        if matches is not None:
+            print("⚡ Using local search engine")
+
+    if matches is None:
+        resp = index.query(
+            vector=query_embedding,
+            top_k=args.top_k,
+            include_metadata=True,
+            filter={"chapterId": args.chapter_id} if args.chapter_id else None,
+        )
+        matches = resp.get("matches", [])
     
     if not matches:
         print("No results found")
@@ -351,9 +402,8 @@ def add_single_record(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("❌ Missing Pinecone environment variables.")
 
-    # Initialize Pinecone
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    # Shared Pinecone index handle
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"➕ Adding new record to chapter: {args.chapter_id}")
     
@@ -400,6 +450,10 @@ def add_single_record(args):
         print(f"   Created At: {created_at}")
     except Exception as e:
         print(f"❌ Error adding record: {e}")
+        return
+
+    sync_catalog(record_upserts, args.chapter_id, PINECONE_INDEX_NAME, {record_id: metadata})
+    sync_metadata(save_metadata, PINECONE_INDEX_NAME, {record_id: metadata})
 
 def get_record(args):
     """Get a specific record by ID"""
@@ -410,8 +464,7 @@ def get_record(args):
     if not all([PINECONE_API_KEY, PINECONE_INDEX_NAME, PINECONE_INDEX_HOST]):
         raise SystemExit("❌ Missing Pinecone environment variables.")
 
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    index = pc.Index(name=PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+    index = get_index(PINECONE_INDEX_NAME, PINECONE_INDEX_HOST)
 
     print(f"🔍 Fetching record with ID: '{args.record_id}'...")
     
@@ -453,6 +506,65 @@ def get_record(args):
     except Exception as e:
         print(f"❌ Error fetching record: {e}")
 
+def configured_indexes():
+    """(name, host) of every configured index: text, image, video, audio"""
+    indexes = [
+        (os.getenv("KABIR_INDEX_NAME"), os.getenv("KABIR_INDEX_HOST")),
+        (os.getenv("PINECONE_INDEX_NAME"), os.getenv("PINECONE_INDEX_HOST")),
+        (os.getenv("PINECONE_INDEX_NAME2"), os.getenv("PINECONE_INDEX_HOST2")),
+        (os.getenv("PINECONE_INDEX_NAME3"), os.getenv("PINECONE_INDEX_HOST3")),
+    ]
+    return [(name, host) for name, host in indexes if name and host]
+
+def rebuild_catalog(args):
+    """Rebuild the chapter catalog entry for a chapter from every configured index"""
+    print(f"📚 Rebuilding chapter catalog for chapterId='{args.chapter_id}'...")
+    for name, host in configured_indexes():
+        print(f"🔍 Listing records in index '{name}'...")
+        sync_catalog(refresh_chapter_index, args.chapter_id, name, host)
+
+    if args.search_engine:
+        engine = None if args.search_engine == "auto" else args.search_engine
+        set_search_engine(args.chapter_id, engine)
+        print(f"⚙️ Search engine for '{args.chapter_id}': {args.search_engine}")
+
+def snapshot_chapter(args):
+    """Write memory-mappable vector snapshots of a chapter for the local search engine"""
+    indexes = configured_indexes()
+    if args.index:
+        indexes = [(name, host) for name, host in indexes if name == args.index]
+        if not indexes:
+            raise SystemExit(f"❌ Unknown index: {args.index}")
+
+    # Snapshots are tagged with the catalog version; make sure every index is catalogued first
+    entry = get_chapter_entry(args.chapter_id) or {}
+    for name, host in indexes:
+        if name not in (entry.get("indexes") or {}):
+            sync_catalog(refresh_chapter_index, args.chapter_id, name, host)
+    version = (get_chapter_entry(args.chapter_id) or {}).get("version")
+
+    print(f"📸 Snapshotting chapterId='{args.chapter_id}' (catalog version {version}, {args.dtype})...")
+    for name, host in indexes:
+        records = local_index.list_chapter_records(name, host, args.chapter_id)
+        if len(records) >= local_index.LOCAL_INDEX_MAX_RECORDS:
+            print(f"⚠️ Skipping '{name}': {len(records)}+ records is too large for the local engine")
+            continue
+
+        paths = write_snapshot(name, args.chapter_id, records, dtype=args.dtype,
+                               catalog_version=version, directory=args.out_dir)
+        size_kb = sum(os.path.getsize(p) for p in paths) / 1024
+        print(f"✅ {name}: {len(records)} records -> {os.path.dirname(paths[0])} ({size_kb:.1f} KB)")
+
+        if args.upload:
+            for blob_name in upload_snapshot(name, args.chapter_id, directory=args.out_dir):
+                print(f"☁️ Uploaded {blob_name}")
+
+def prune_embeddings(args):
+    """Apply age/size eviction to the shared Firestore embedding cache"""
+    print("🧹 Pruning shared embedding cache...")
+    deleted = prune_embedding_store(max_docs=args.max_docs, max_age_days=args.max_age_days)
+    print(f"✅ Deleted {deleted} cached embeddings")
+
 def main():
     parser = argparse.ArgumentParser(description="Pinecone Chapter Data Management")
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
@@ -486,6 +598,8 @@ def main():
     search_parser.add_argument("--query", required=True, help="Search query text")
     search_parser.add_argument("--chapter-id", help="Filter by chapter ID (optional)")
     search_parser.add_argument("--top-k", type=int, default=5, help="Number of results")
+    search_parser.add_argument("--engine", choices=["auto", "local", "pinecone"], default="auto",
+                               help="auto = the chapter's configured engine; local needs --chapter-id")
 
     # Delete command
     delete_parser = subparsers.add_parser('delete', help='Delete a specific record')
@@ -501,6 +615,25 @@ def main():
     list_parser.add_argument("--dim", type=int, default=1536, help="Vector dimension")
     list_parser.add_argument("--top-k", type=int, default=5000, help="Max records to fetch")
 
+    # Catalog command
+    catalog_parser = subparsers.add_parser('catalog', help='Rebuild the chapter catalog entry for a chapter')
+    catalog_parser.add_argument("--chapter-id", required=True, help="Chapter ID to catalog")
+    catalog_parser.add_argument("--search-engine", choices=["auto", "local", "pinecone"],
+                                help="Pin the chapter to the local or Pinecone search engine (auto = LOCAL_SEARCH_CHAPTERS)")
+
+    # Snapshot command
+    snapshot_parser = subparsers.add_parser('snapshot', help='Write vector snapshots of a chapter for the local search engine')
+    snapshot_parser.add_argument("--chapter-id", required=True, help="Chapter ID to snapshot")
+    snapshot_parser.add_argument("--index", help="Only this index name (default: all configured indexes)")
+    snapshot_parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="float32", help="Stored vector precision")
+    snapshot_parser.add_argument("--out-dir", help="Output directory (default: functions/snapshots, shipped with the functions)")
+    snapshot_parser.add_argument("--upload", action="store_true", help="Also upload to Cloud Storage (CHAPTER_SNAPSHOT_PREFIX)")
+
+    # Prune embedding cache command
+    prune_parser = subparsers.add_parser('prune-embeddings', help='Evict old/excess entries from the shared embedding cache')
+    prune_parser.add_argument("--max-docs", type=int, help="Max cached embeddings to keep (default: EMBEDDING_STORE_MAX_DOCS)")
+    prune_parser.add_argument("--max-age-days", type=float, help="Drop entries unused for this many days (default: EMBEDDING_STORE_MAX_AGE_DAYS)")
+
     args = parser.parse_args()
 
     if args.command == 'export':
@@ -519,6 +652,12 @@ def main():
         delete_all_records(args)
     elif args.command == 'list':
         list_records(args)
+    elif args.command == 'catalog':
+        rebuild_catalog(args)
+    elif args.command == 'snapshot':
+        snapshot_chapter(args)
+    elif args.command == 'prune-embeddings':
+        prune_embeddings(args)
     else:
         parser.print_help()
 
@@ -81,6 +81,9 @@
 from firebase_admin import firestore, storage, credentials, initialize_app, get_app
 import os
 
+# Writes per batch commit, under Firestore's limit of 500
+FIRESTORE_BATCH_LIMIT = 450
+
 
 def _get_service_account_path() -> str:
     """
@@ -0,0 +1,64 @@
+# http_session.py
+#
+# Shared outbound HTTP layer for calls to our own services (Cloud Run, Cloud
+# Functions). One requests.Session per host, kept for the life of the instance, so
+# warm requests reuse open keep-alive connections instead of a new TCP + TLS setup.
+#
+# Retries: connection failures are always retried (nothing reached the server);
+# 502/503/504 responses only for idempotent methods, so a POST that may have
+# written messages is never sent twice.
+import os
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+# Connections kept open per host
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.2"))  # 0.2 s, 0.4 s, ...
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _new_session() -> requests.Session:
+    retry = Retry(
+        total=None,
+        connect=HTTP_RETRIES,
+        read=0,
+        status=HTTP_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the shared Session for the host of `url`, creating it on first use"""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _new_session()
+    return session
+
+
+def post(url: str, timeout: float = None, **kwargs) -> requests.Response:
+    """requests.post(...) over the pooled session of the url's host"""
+    timeout = HTTP_TIMEOUT_SECONDS if timeout is None else timeout
+    return get_session(url).post(url, timeout=timeout, **kwargs)
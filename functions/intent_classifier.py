@@ -0,0 +1,303 @@
+# intent_classifier.py
+#
+# Local fast path for process_text's intent classification. Obvious requests
+# ("show me photos of India Gate", "वीडियो दिखाओ", "gaana sunao") are answered here;
+# only uncertain ones go to the LLM.
+#
+#   1. rules: compiled English / Hindi / Hinglish cue patterns, used when exactly
+#      one intent's cues are present
+#   2. cue scores: hand-set weights over token + bigram features, softmax-normalized
+#      per intent, used when the top score reaches LOCAL_INTENT_MIN_SCORE. It has the
+#      form of a logistic model but is not one: there is no labelled traffic to fit
+#      it on yet (INTENT_EXAMPLES is six utterances per intent), so the weights are
+#      set by hand and the scores are not calibrated probabilities
+#   3. embedding: cosine similarity of the query embedding (the same vector the
+#      search then uses) to centroids of labelled example utterances, used when
+#      the best centroid beats the runner-up by INTENT_CENTROID_MIN_MARGIN
+#   4. otherwise None -> caller asks the LLM
+#
+# classify_all() also recognises compound requests ("show me a photo and play the
+# audio story"): clauses joined by a conjunction, each naming a different media type.
+import os
+import re
+import math
+import logging
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from embedding_cache import get_embedding, get_embeddings
+
+load_dotenv(".env.dev")
+
+LOCAL_INTENT_ENABLED = os.getenv("LOCAL_INTENT_ENABLED", "1") == "1"
+LOCAL_INTENT_MIN_SCORE = float(os.getenv("LOCAL_INTENT_MIN_SCORE", "0.85"))
+INTENT_EMBEDDINGS_ENABLED = os.getenv("INTENT_EMBEDDINGS_ENABLED", "1") == "1"
+# ada-002 similarities sit close together; require a clear winner
+INTENT_CENTROID_MIN_MARGIN = float(os.getenv("INTENT_CENTROID_MIN_MARGIN", "0.03"))
+# Log the locally handled share every N classifications
+LOCAL_INTENT_LOG_EVERY = 100
+
+INTENT_LABELS = ("search_image", "search_audio", "search_video", "web_search", "generate_image")
+
+# Devanagari vowel signs are not \w, so split on whitespace/punctuation instead
+_TOKEN_SPLIT = re.compile(r"[\s.,!?;:\"'()\[\]{}|/\\\-–—।]+")
+
+# "make / draw / create ... image" outranks the media nouns it contains
+_GENERATE_RULE = re.compile(
+    r"\b(create|generate|draw|paint|design|make|imagine)\b.*\b(image|picture|photo|drawing|painting|art|poster)s?\b"
+    r"|\b(image|picture|photo|tasve?er|tasvir)s?\b.*\b(bana\s*do|banao|generate\s+karo|create\s+karo)\b"
+    r"|(चित्र|तस्वीर|फोटो|इमेज).*(बनाओ|बना\s*दो)",
+    re.IGNORECASE,
+)
+_MEDIA_RULES = {
+    "search_video": re.compile(r"\b(videos?|clips?|footage)\b|वीडियो|विडियो", re.IGNORECASE),
+    "search_audio": re.compile(
+        r"\b(audio|listen|hear|songs?|podcasts?|narration|sunao|suna\s*do|gaana|gana)\b|ऑडियो|सुनाओ|गाना|आवाज़",
+        re.IGNORECASE,
+    ),
+    "search_image": re.compile(
+        r"\b(pictures?|photos?|images?|pics?|photographs?|tasve?er|tasvir)\b|फोटो|तस्वीर|चित्र|इमेज",
+        re.IGNORECASE,
+    ),
+}
+# Joins the clauses of a compound request (commas, "bhi" and "saath" alone do not)
+_CONJUNCTION = re.compile(r"\b(?:and|plus|as\s+well\s+as|aur)\b|&|और", re.IGNORECASE)
+
+# Cue scores: hand-set per-feature weights per intent (unlisted features weigh 0).
+# Not fitted from data; see the header
+_CUE_BIAS = {
+    "search_image": 0.3,
+    "search_audio": 0.0,
+    "search_video": 0.0,
+    "web_search": 0.2,
+    "generate_image": -0.5,
+}
+_CUE_WEIGHTS = {
+    "search_image": {
+        "picture": 3.0, "pictures": 3.0, "photo": 3.0, "photos": 3.0, "image": 2.5, "images": 2.5,
+        "pic": 2.5, "pics": 2.5, "show": 1.0, "see": 0.8, "look": 0.8, "view": 0.8, "looks": 1.0,
+        "dikhao": 0.8, "tasveer": 3.0, "tasvir": 3.0, "फोटो": 3.0, "तस्वीर": 3.0, "चित्र": 2.5,
+        "दिखाओ": 0.8, "show me": 1.2, "looks like": 1.5,
+    },
+    "search_audio": {
+        "audio": 3.0, "listen": 2.5, "hear": 2.5, "song": 2.5, "songs": 2.5, "sound": 2.0,
+        "sounds": 2.0, "music": 2.5, "podcast": 2.5, "narration": 2.5, "story": 0.8, "sunao": 2.5,
+        "suno": 2.0, "gaana": 2.5, "ऑडियो": 3.0, "गाना": 2.5, "सुनाओ": 2.5, "आवाज़": 2.0,
+        "listen to": 1.0,
+    },
+    "search_video": {
+        "video": 3.0, "videos": 3.0, "clip": 2.5, "clips": 2.5, "film": 2.0, "movie": 2.0,
+        "watch": 2.0, "play": 1.2, "footage": 2.5, "वीडियो": 3.0, "देखना": 1.5, "play video": 1.0,
+    },
+    "web_search": {
+        "what": 1.5, "who": 1.5, "when": 1.5, "why": 1.8, "how": 1.5, "where": 1.2, "history": 2.0,
+        "tell": 1.2, "explain": 2.0, "about": 0.8, "built": 1.2, "kya": 1.5, "kaun": 1.5, "kab": 1.5,
+        "kyun": 1.8, "kaise": 1.5, "itihas": 2.0, "batao": 1.2, "क्या": 1.5, "कौन": 1.5, "कब": 1.5,
+        "क्यों": 1.8, "इतिहास": 2.0, "बताओ": 1.2, "tell me": 1.0,
+    },
+    "generate_image": {
+        "create": 2.5, "generate": 2.5, "draw": 3.0, "make": 1.5, "design": 2.0, "paint": 2.5,
+        "imagine": 2.0, "banao": 2.5, "bana": 2.0, "बनाओ": 2.5, "an image": 0.5,
+    },
+}
+
+# Labelled utterances whose mean embedding is each intent's centroid
+INTENT_EXAMPLES = {
+    "search_image": [
+        "Show me pictures of India Gate",
+        "Do you have a photo of this monument?",
+        "What does the fort look like?",
+        "Any images of the old city?",
+        "India Gate ki tasveer dikhao",
+        "इंडिया गेट की फोटो दिखाओ",
+    ],
+    "search_audio": [
+        "Find audio about Delhi",
+        "I want to listen to the story of this place",
+        "Play a song from this region",
+        "Is there a narration I can hear?",
+        "Iske baare mein audio sunao",
+        "इसकी कहानी सुनाओ",
+    ],
+    "search_video": [
+        "Play video of Republic Day",
+        "Show me a clip of the parade",
+        "Can I watch a video of this place?",
+        "Any footage of the ceremony?",
+        "Iska video dikhao",
+        "इसका वीडियो दिखाओ",
+    ],
+    "web_search": [
+        "What is the history of India Gate?",
+        "Who built this monument?",
+        "When was it constructed and why?",
+        "Tell me about the architect",
+        "Yeh kab bana tha?",
+        "इसका इतिहास क्या है?",
+    ],
+    "generate_image": [
+        "Create an image of a sunset",
+        "Draw the monument at night",
+        "Generate a picture of me in front of the gate",
+        "Make a painting of this place in the rain",
+        "Iski ek image bana do",
+        "इसकी एक तस्वीर बनाओ",
+    ],
+}
+
+_lock = threading.Lock()
+_stats = {"rules": 0, "cue_scores": 0, "embedding": 0, "llm": 0}
+_centroids = None  # (labels, unit centroid matrix)
+_centroids_lock = threading.Lock()
+
+
+def _features(text: str) -> list:
+    tokens = [t for t in _TOKEN_SPLIT.split(text.casefold()) if t]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _by_rules(text: str):
+    if _GENERATE_RULE.search(text):
+        return "generate_image"
+    matched = [intent for intent, rule in _MEDIA_RULES.items() if rule.search(text)]
+    return matched[0] if len(matched) == 1 else None
+
+
+def _compound_by_rules(text: str):
+    """
+    Media intents of a compound request in the order they are mentioned, else None.
+    Every clause between conjunctions may name at most one media type; a clause
+    naming several ("video of the audio guide") is left to the other paths.
+    """
+    if _GENERATE_RULE.search(text):
+        return None
+    clauses = _CONJUNCTION.split(text)
+    if len(clauses) < 2:
+        return None
+
+    intents = []
+    for clause in clauses:
+        matched = [intent for intent, rule in _MEDIA_RULES.items() if rule.search(clause)]
+        if len(matched) > 1:
+            return None
+        if matched and matched[0] not in intents:
+            intents.append(matched[0])
+    return intents if len(intents) > 1 else None
+
+
+def rule_scores(text: str) -> dict:
+    """
+    Cue scores per intent, normalized to sum to 1 with a softmax. A heuristic ranking
+    from the hand-set _CUE_WEIGHTS, not a trained model's calibrated probabilities.
+    """
+    features = _features(text)
+    scores = {
+        intent: _CUE_BIAS[intent] + sum(_CUE_WEIGHTS[intent].get(f, 0.0) for f in features)
+        for intent in INTENT_LABELS
+    }
+    top = max(scores.values())
+    exp = {intent: math.exp(s - top) for intent, s in scores.items()}
+    total = sum(exp.values())
+    return {intent: e / total for intent, e in exp.items()}
+
+
+def _record(source: str) -> None:
+    with _lock:
+        _stats[source] += 1
+        total = sum(_stats.values())
+        if total % LOCAL_INTENT_LOG_EVERY == 0:
+            local = total - _stats["llm"]
+            logging.info(f"[intent_classifier] {total} requests, {local / total:.1%} classified locally")
+
+
+def classify_locally(text: str):
+    """Intent from the rules or a clear cue score, else None"""
+    if not LOCAL_INTENT_ENABLED or not text:
+        return None
+
+    intent = _by_rules(text)
+    if intent:
+        _record("rules")
+        return intent
+
+    scores = rule_scores(text)
+    intent = max(scores, key=scores.get)
+    if scores[intent] >= LOCAL_INTENT_MIN_SCORE:
+        _record("cue_scores")
+        return intent
+
+    return None
+
+
+def _get_centroids(client):
+    """Embed the example utterances once per instance (one batched, cached call)"""
+    global _centroids
+    with _centroids_lock:
+        if _centroids is None:
+            labels = list(INTENT_EXAMPLES)
+            texts = [t for label in labels for t in INTENT_EXAMPLES[label]]
+            vectors = np.asarray(get_embeddings(texts, client), dtype=np.float32)
+
+            rows, start = [], 0
+            for label in labels:
+                n = len(INTENT_EXAMPLES[label])
+                centroid = vectors[start:start + n].mean(axis=0)
+                rows.append(centroid / np.linalg.norm(centroid))
+                start += n
+            _centroids = (labels, np.vstack(rows))
+        return _centroids
+
+
+def classify_by_embedding(query_vector, client):
+    """Intent whose example centroid is clearly closest to the query embedding, else None"""
+    if not INTENT_EMBEDDINGS_ENABLED or query_vector is None:
+        return None
+
+    labels, matrix = _get_centroids(client)
+    q = np.asarray(query_vector, dtype=np.float32)
+    sims = matrix @ (q / (np.linalg.norm(q) or 1.0))
+    second, best = np.argsort(sims)[-2:]
+    if sims[best] - sims[second] >= INTENT_CENTROID_MIN_MARGIN:
+        _record("embedding")
+        return labels[best]
+    return None
+
+
+def classify(text: str, client=None, embed=None):
+    """
+    (intent, query_vector) from the local fast paths; intent is None when the LLM has
+    to decide. The query embedding is only computed when the text alone is not enough,
+    and is returned so the search can reuse it. `embed` returns the query embedding
+    (e.g. one already being computed), defaulting to get_embedding.
+    """
+    intent = classify_locally(text)
+    query_vector = None
+    if intent is None and INTENT_EMBEDDINGS_ENABLED and client is not None and text:
+        query_vector = embed() if embed is not None else get_embedding(text, client)
+        intent = classify_by_embedding(query_vector, client)
+    if intent is None:
+        _record("llm")
+    return intent, query_vector
+
+
+def classify_all(text: str, client=None, embed=None):
+    """
+    (intents, query_vector) like classify(), but a compound request yields every
+    intent it asks for. intents is None when the LLM has to decide.
+    """
+    if LOCAL_INTENT_ENABLED and text:
+        intents = _compound_by_rules(text)
+        if intents:
+            _record("rules")
+            return intents, None
+
+    intent, query_vector = classify(text, client, embed)
+    return ([intent] if intent else None), query_vector
+
+
+def local_intent_stats() -> dict:
+    with _lock:
+        total = sum(_stats.values())
+        local = total - _stats["llm"]
+        return {**_stats, "local_share": round(local / total, 4) if total else 0.0}
@@ -0,0 +1,197 @@
+# local_index.py
+#
+# Optional in-process vector search for small chapters. On first use every record a
+# Pinecone index holds for a chapter (vectors + metadata) is loaded into a float32
+# matrix; chapterId-filtered queries are then answered with one matrix-vector product
+# and a top-k selection instead of a Pinecone round trip.
+#
+# Which chapters run locally:
+#   - chapterCatalog/{chapterId}.searchEngine = "local" | "pinecone"
+#     (set with `exportChapterData.py catalog --search-engine`), otherwise
+#   - LOCAL_SEARCH_CHAPTERS: comma separated chapterIds, "*" for all, empty for none
+# A loaded chapter is reloaded as soon as its catalog version changes. A snapshot of
+# the chapter/index (see chapter_snapshot.py) is memory-mapped instead of listing it
+# from Pinecone; while the snapshot is behind the catalog version the chapter is
+# queried on Pinecone as usual.
+import os
+import logging
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from pinecone_setup import get_index
+from chapter_catalog import get_chapter_entry, EMBEDDING_DIM
+from ttl_cache import TTLCache
+import chapter_snapshot
+import record_metadata
+import resilience
+from request_timing import stage
+
+load_dotenv(".env.dev")
+
+SEARCH_ENGINES = ("local", "pinecone")
+
+LOCAL_SEARCH_CHAPTERS = {
+    c.strip() for c in os.getenv("LOCAL_SEARCH_CHAPTERS", "").split(",") if c.strip()
+}
+# Chapters with more records than this stay on Pinecone (also the listing query's top_k)
+LOCAL_INDEX_MAX_RECORDS = int(os.getenv("LOCAL_INDEX_MAX_RECORDS", "1000"))
+LOCAL_INDEX_MAX_BYTES = int(os.getenv("LOCAL_INDEX_MAX_BYTES", str(128 * 1024 * 1024)))
+# Uncatalogued chapters have no version to compare against; reload them after this long
+LOCAL_INDEX_TTL = float(os.getenv("LOCAL_INDEX_TTL", "600"))
+
+
+class ChapterMatrix:
+    """All records of one chapter in one index, as unit-normalized rows (in memory or memory-mapped)"""
+
+    def __init__(self, ids: list, vectors: np.ndarray, metadata: list):
+        self.ids = ids
+        self.vectors = vectors
+        self.metadata = metadata
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+    def query(self, vector, top_k: int) -> list:
+        """Pinecone-shaped matches ({id, score, metadata}), best first; indexes use cosine"""
+        if not self.ids:
+            return []
+
+        q = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm:
+            q = q / norm
+        scores = self.vectors @ q
+
+        k = min(top_k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(self.ids) else np.arange(k)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {"id": self.ids[i], "score": float(scores[i]), "metadata": dict(self.metadata[i])}
+            for i in top
+        ]
+
+
+# (index name, chapterId) -> (catalog version, ChapterMatrix or None if too large / snapshot stale)
+_matrices = TTLCache(
+    maxsize=1024,
+    ttl=LOCAL_INDEX_TTL,
+    name="local_index",
+    max_bytes=LOCAL_INDEX_MAX_BYTES,
+    sizeof=lambda item: item[1].nbytes if item[1] is not None else 0,
+)
+# Striped so concurrent first queries for a chapter load it once
+_load_locks = [threading.Lock() for _ in range(32)]
+
+
+def search_engine_for(chapter_id: str) -> str:
+    """Search engine ("local" or "pinecone") configured for this chapter"""
+    engine = (get_chapter_entry(chapter_id) or {}).get("searchEngine")
+    if engine in SEARCH_ENGINES:
+        return engine
+    if "*" in LOCAL_SEARCH_CHAPTERS or chapter_id in LOCAL_SEARCH_CHAPTERS:
+        return "local"
+    return "pinecone"
+
+
+def list_chapter_records(index_name: str, index_host: str, chapter_id: str) -> list:
+    """Every record (id, values, metadata) an index holds for a chapter, in one listing query"""
+    index = get_index(index_name, index_host)
+    with stage("pinecone"):
+        resp = resilience.call("pinecone_list", lambda: index.query(
+            vector=[0.0] * EMBEDDING_DIM,
+            top_k=LOCAL_INDEX_MAX_RECORDS,
+            filter={"chapterId": chapter_id},
+            include_metadata=True,
+            include_values=True,
+        ))
+    return resp.get("matches", [])
+
+
+def _load(index_name: str, index_host: str, chapter_id: str, version=None):
+    try:
+        snapshot = chapter_snapshot.open_snapshot(index_name, chapter_id)
+    except Exception as e:
+        logging.warning(f"[local_index] Could not open snapshot of {chapter_id} on {index_name}: {e}")
+        snapshot = None
+
+    if snapshot is not None:
+        if version is not None and snapshot.catalog_version != version:
+            # Not relisted: the chapter stays on Pinecone until a new snapshot ships
+            logging.info(
+                f"[local_index] Snapshot of {chapter_id} on {index_name} is at catalog version "
+                f"{snapshot.catalog_version}, catalog is at {version}; querying Pinecone"
+            )
+            return None
+        logging.info(f"[local_index] Mapped snapshot of {chapter_id} on {index_name}: {len(snapshot.ids)} records")
+        return ChapterMatrix(snapshot.ids, snapshot.vectors, snapshot.metadata)
+
+    matches = list_chapter_records(index_name, index_host, chapter_id)
+    if len(matches) >= LOCAL_INDEX_MAX_RECORDS:
+        logging.info(
+            f"[local_index] {chapter_id} on {index_name} has {LOCAL_INDEX_MAX_RECORDS}+ records; staying on Pinecone"
+        )
+        return None
+
+    if not matches:
+        logging.info(f"[local_index] {chapter_id} has no records on {index_name}")
+        return ChapterMatrix([], np.zeros((0, 0), dtype=np.float32), [])
+
+    vectors = np.array([m["values"] for m in matches], dtype=np.float32).reshape(len(matches), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+
+    record_metadata.remember(index_name, {m["id"]: m.get("metadata") or {} for m in matches})
+    logging.info(f"[local_index] Loaded {chapter_id} on {index_name}: {len(matches)} records")
+    return ChapterMatrix(
+        [m["id"] for m in matches],
+        vectors,
+        [m.get("metadata") or {} for m in matches],
+    )
+
+
+def get_chapter_matrix(index_name: str, index_host: str, chapter_id: str):
+    """The loaded matrix for a chapter/index, reloading it if the catalog version moved on"""
+    version = (get_chapter_entry(chapter_id) or {}).get("version")
+    key = (index_name, chapter_id)
+
+    cached = _matrices.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _load_locks[hash(key) % len(_load_locks)]:
+        cached = _matrices.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        matrix = _load(index_name, index_host, chapter_id, version)
+        _matrices.set(key, (version, matrix))
+        return matrix
+
+
+def query(index_name: str, index_host: str, chapter_id: str, vector, top_k: int = 1, engine: str = None):
+    """
+    Matches for a chapterId-filtered query from the local engine, or None when the
+    caller should query Pinecone (chapter not switched to local, too large, stale
+    snapshot, or load failed).
+    `engine` overrides the per-chapter setting.
+    """
+    if (engine or search_engine_for(chapter_id)) != "local":
+        return None
+
+    try:
+        matrix = get_chapter_matrix(index_name, index_host, chapter_id)
+    except Exception as e:
+        logging.warning(f"[local_index] Could not load {chapter_id} on {index_name}: {e}")
+        return None
+
+    if matrix is None:
+        return None
+    with stage("local_search"):
+        return matrix.query(vector, top_k)
+
+
+def local_index_stats() -> dict:
+    return _matrices.stats()
@@ -12,6 +12,7 @@ initialize_app()
 from imageSearch import searchImageFromDatabase
 from videoSearch import searchVideoFromDatabase
 from audioSearch import searchAudioFromDatabase
+from mediaSearch import searchMediaFromDatabase, searchMediaBatch
 from deviceRedirect import device_redirect
 from chatSuggestionData import chatSuggestionData
 from process_text import process_text
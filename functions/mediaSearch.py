@@ -0,0 +1,569 @@
+from firebase_functions import https_fn
+from firebase_functions.https_fn import Request
+from datetime import datetime
+import logging
+import os
+import json
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FuturesTimeout
+from dotenv import load_dotenv
+
+from firebase_setup import get_project_b_firestore
+from openai_setup import client
+from pinecone_setup import warm_index
+from chapter_catalog import chapter_has_records, get_chapter_entry
+from embedding_cache import get_embedding, get_embeddings, normalize_text
+from stage_runner import run_stages, deadline_in, StageTimeout, ALL_STAGES
+import semantic_cache
+import singleflight
+import local_index
+from record_metadata import query_matches
+from message_writer import write_message, write_messages
+from chat_cache import get_chat, chat_exists
+from request_timing import timed_request
+from resilience import DependencyError
+from result_cursor import CURSOR_CANDIDATES, is_follow_up, save_cursor, next_from_cursor, invalidate
+
+# Load environment variables
+load_dotenv(".env.dev")
+
+# Get Firestore client for project B
+project_b_db = get_project_b_firestore()
+
+# Per media type: Pinecone index, metadata keys and the chat user_id its messages are written as
+MEDIA_TYPES = {
+    "image": {
+        "index_name": os.getenv("PINECONE_INDEX_NAME"),
+        "index_host": os.getenv("PINECONE_INDEX_HOST"),
+        "desc_key": "imageDesc",
+        "url_key": "imageURL",
+        "user_id": "ImageG",
+        "not_found": "Sorry, I don't have an image for this place. Kindly upload or generate a relevant one.",
+        "low_score": "This is the closest image I could find—feel free to upload a more relevant one!",
+        "no_url": "No image URL found.",
+    },
+    "audio": {
+        "index_name": os.getenv("PINECONE_INDEX_NAME3"),
+        "index_host": os.getenv("PINECONE_INDEX_HOST3"),
+        "desc_key": "audioDesc",
+        "url_key": "audioURL",
+        "user_id": "AudioG",
+        "not_found": "Sorry, I don't have a audio for this place. Kindly upload or generate a relevant one.",
+        "low_score": "This is the closest audio I could find—feel free to upload a more relevant one!",
+        "no_url": "No audio URL found.",
+    },
+    "video": {
+        "index_name": os.getenv("PINECONE_INDEX_NAME2"),
+        "index_host": os.getenv("PINECONE_INDEX_HOST2"),
+        "desc_key": "videoDesc",
+        "url_key": "videoURL",
+        "user_id": "VideoG",
+        "not_found": "Sorry, I don't have a video for this place. Kindly upload or generate a relevant one.",
+        "low_score": "This is the closest video I could find—feel free to upload a more relevant one!",
+        "no_url": "No video URL found.",
+    },
+}
+
+# Below this score the closest match is sent with a "feel free to upload" note
+LOW_SCORE_THRESHOLD = 0.757
+
+# Written by searchMediaFromDatabase when no media type has a match
+NO_MEDIA_MESSAGE = "Sorry, I don't have any media for this place. Kindly upload or generate a relevant one."
+NO_MEDIA_USER_ID = "MediaG"
+
+# Batch mode (searchMediaBatch)
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "256"))
+# Largest topK a batch may ask for; larger values are clamped to it
+MAX_BATCH_TOP_K = int(os.getenv("MAX_BATCH_TOP_K", str(CURSOR_CANDIDATES)))
+BATCH_QUERY_CONCURRENCY = int(os.getenv("BATCH_QUERY_CONCURRENCY", "8"))
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "120"))
+
+for _media_type, _cfg in MEDIA_TYPES.items():
+    if not _cfg["index_host"]:
+        raise EnvironmentError(f"Missing Pinecone index host for {_media_type} search")
+    # Open the shared index handle ahead of the first request (PINECONE_WARMUP=1)
+    warm_index(_cfg["index_name"], _cfg["index_host"])
+
+
+# -------------------------
+# Helpers
+# -------------------------
+def to_response(body, status: int) -> https_fn.Response:
+    """Turn an engine result (dict -> JSON, str -> plain text) into an HTTP response"""
+    if isinstance(body, (dict, list)):
+        return https_fn.Response(json.dumps(body), status=status, content_type="application/json")
+    return https_fn.Response(body, status=status)
+
+
+def _parse_request(data):
+    """Validate the payload shared by all media searches; returns (params, error)"""
+    if not data:
+        return None, ("Invalid JSON payload", 400)
+
+    params = {k: data.get(k) for k in ("chapterId", "chatId", "content", "lat", "long", "location")}
+    if not all(params.values()):
+        return None, ("Missing required parameters", 400)
+
+    return params, None
+
+
+def _chat_not_found(chatId: str):
+    return {"error": f"Chat ID '{chatId}' not found in Project B."}, 404
+
+
+def _not_found_reply(media_type: str, chatId: str, chat_doc_ref, location: str):
+    """Write the media type's "Sorry, I don't have ..." message and return the response"""
+    invalidate(chatId, media_type)
+    message_data = _message(MEDIA_TYPES[media_type]["user_id"], MEDIA_TYPES[media_type]["not_found"], None, location)
+    write_message(project_b_db, _new_message_ref(chat_doc_ref, message_data), message_data)
+    return {"message": "Message written to Firestore", **_result(message_data, 0.0)}, 200
+
+
+def _has_records(media_type: str, chapterId: str) -> bool:
+    cfg = MEDIA_TYPES[media_type]
+    return chapter_has_records(chapterId, cfg["index_name"], cfg["index_host"])
+
+
+def _query_media(media_type: str, query_vector: list, chapterId: str, top_k: int = 1) -> list:
+    cfg = MEDIA_TYPES[media_type]
+    matches = local_index.query(cfg["index_name"], cfg["index_host"], chapterId, query_vector, top_k)
+    if matches is not None:
+        return matches
+
+    # Metadata is hydrated from the side-store for the returned ids only
+    return query_matches(cfg["index_name"], cfg["index_host"], query_vector, top_k, {"chapterId": chapterId})
+
+
+def _find_matches(media_type: str, query_vector: list, chapterId: str, top_k: int = 1, text: str = None) -> list:
+    """
+    Matches for a query, reusing the results of a near-duplicate recent query when possible.
+    With the query `text`, identical concurrent searches share one in-flight query.
+    """
+    scope = f"{media_type}:{top_k}"
+
+    def _search():
+        # Cached matches only count for the catalog version they were found under
+        version = (get_chapter_entry(chapterId) or {}).get("version")
+        matches = semantic_cache.lookup(scope, chapterId, query_vector, version)
+        if matches is None:
+            matches = _query_media(media_type, query_vector, chapterId, top_k=top_k)
+            semantic_cache.store(scope, chapterId, query_vector, matches, version)
+        return matches
+
+    if text is None:
+        return _search()
+    return singleflight.do((scope, chapterId, normalize_text(text)), _search)
+
+
+def prefetch_matches(media_type: str, query_vector: list, chapterId: str, content: str = None) -> list:
+    """The candidates search_media would query, fetched ahead of time (process_text speculation)"""
+    return _find_matches(media_type, query_vector, chapterId, top_k=CURSOR_CANDIDATES, text=content)
+
+
+def _search_candidates(media_type: str, content: str, chapterId: str, query_vector=None, prefetched=None) -> list:
+    """Candidates from the prefetch if it succeeded, else from a query"""
+    if prefetched is not None:
+        try:
+            return prefetched.result()
+        except CancelledError:
+            pass
+        except DependencyError:
+            raise  # querying again would hit the same unhealthy dependency
+        except Exception as e:
+            logging.warning(f"Prefetched {media_type} search failed, querying again: {e}")
+    if query_vector is None:
+        query_vector = get_embedding(content, client)
+    return _find_matches(media_type, query_vector, chapterId, top_k=CURSOR_CANDIDATES, text=content)
+
+
+def _describe_match(media_type: str, match: dict):
+    """(description, url, score) for a Pinecone match, with the low-score note if needed"""
+    cfg = MEDIA_TYPES[media_type]
+    score = match["score"]
+    metadata = match.get("metadata") or {}
+    description = metadata.get(cfg["desc_key"], "No description found.")
+    url = metadata.get(cfg["url_key"], cfg["no_url"])
+
+    if score <= LOW_SCORE_THRESHOLD:
+        description += "\n\n" + cfg["low_score"]
+
+    return description, url, score
+
+
+def _message(user_id: str, description: str, url, location: str) -> dict:
+    return {
+        "content": description,
+        "image_url": url,
+        "created_at": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+        "location": location,
+        "role": "assistant",
+        "user_id": user_id,
+    }
+
+
+def _result(message_data: dict, score: float) -> dict:
+    """Response fields describing one written assistant message"""
+    return {
+        "id": message_data["id"],
+        "score": score,
+        "content": message_data["content"],
+        "created_at": message_data["created_at"],
+        "image_url": message_data["image_url"],
+        "location": message_data["location"],
+        "role": "assistant",
+        "userId": message_data["user_id"],
+    }
+
+
+def _new_message_ref(chat_doc_ref, message_data: dict):
+    doc_ref = chat_doc_ref.collection("messages").document()
+    message_data["id"] = doc_ref.id
+    return doc_ref
+
+
+# -------------------------
+# Engine
+# -------------------------
+def search_media(media_type: str, data: dict, query_vector=None, prefetched=None):
+    """
+    Single media type search (searchImage/Audio/VideoFromDatabase).
+    Returns (body, status); body is a dict for JSON responses, a str otherwise.
+    query_vector: embedding of data["content"] if the caller already has it.
+    prefetched: Future of prefetch_matches(...) for this query, started by the caller.
+    """
+    cfg = MEDIA_TYPES[media_type]
+    try:
+        params, error = _parse_request(data)
+        if error:
+            return error
+
+        chapterId = params["chapterId"]
+        chatId = params["chatId"]
+        content = params["content"]
+        location = params["location"]
+
+        chat_doc_ref = project_b_db.collection("chats").document(chatId)
+
+        # "Show me another one": serve the next candidate of this chat's previous
+        # search without embedding or querying again
+        if data.get("next") or is_follow_up(content):
+            match = next_from_cursor(chatId, media_type, chapterId)
+            if match is not None:
+                description, url, score = _describe_match(media_type, match)
+                message_data = _message(cfg["user_id"], description, url, location)
+                write_message(project_b_db, _new_message_ref(chat_doc_ref, message_data), message_data)
+                return {"message": "Message written to Firestore", **_result(message_data, score)}, 200
+
+        deadline = deadline_in()
+
+        # The chat lookup, the chapter catalog lookup and the query embedding are
+        # independent, so run them concurrently. A missing chat cancels the rest;
+        # a chapter without records cancels the embedding.
+        initial = {
+            "chat": lambda: get_chat(chatId),
+            "has_records": lambda: _has_records(media_type, chapterId),
+        }
+        if query_vector is None and prefetched is None:
+            initial["query_vector"] = lambda: get_embedding(content, client)
+        stages = run_stages(
+            initial,
+            deadline,
+            cancel_when={
+                "chat": (lambda chat: chat is None, ALL_STAGES),
+                "has_records": (lambda has: not has, ("query_vector",)),
+            },
+        )
+
+        if stages["chat"] is None:
+            return _chat_not_found(chatId)
+
+        if not stages["has_records"]:
+            # No records for this chapter
+            return _not_found_reply(media_type, chatId, chat_doc_ref, location)
+
+        # Semantic search (or its prefetched result); extra candidates feed the cursor
+        vector = stages.get("query_vector", query_vector)
+        matches = run_stages(
+            {"search": lambda: _search_candidates(media_type, content, chapterId, vector, prefetched)},
+            deadline,
+        )["search"]
+
+        if not matches:
+            invalidate(chatId, media_type)
+            return "No semantic matches found", 404
+
+        save_cursor(chatId, media_type, chapterId, matches)
+
+        description, url, score = _describe_match(media_type, matches[0])
+        message_data = _message(cfg["user_id"], description, url, location)
+        write_message(project_b_db, _new_message_ref(chat_doc_ref, message_data), message_data)
+
+        return {"message": "Message written to Firestore", **_result(message_data, score)}, 200
+
+    except DependencyError as e:
+        # OpenAI / Pinecone too slow or unhealthy: answer right away as if nothing matched
+        logging.error(f"{media_type}Search falling back: {e}")
+        if get_chat(chatId) is None:
+            return _chat_not_found(chatId)
+        return _not_found_reply(media_type, chatId, chat_doc_ref, location)
+
+    except StageTimeout as e:
+        logging.error(f"{media_type}Search timed out: {e}")
+        return f"Error: {str(e)}", 504
+
+    except Exception as e:
+        logging.exception(f"Error during {media_type}Search")
+        return f"Error: {str(e)}", 500
+
+
+def search_all_media(data: dict):
+    """
+    Multi-modal search: embed once, query every requested media index concurrently,
+    write one assistant message per media type that matched in a single batch.
+    Optional payload field "types" limits the search (e.g. ["image", "video"]).
+    """
+    try:
+        params, error = _parse_request(data)
+        if error:
+            return error
+
+        chapterId = params["chapterId"]
+        chatId = params["chatId"]
+        content = params["content"]
+        location = params["location"]
+
+        media_types, requested = _requested_types(data)
+        if not media_types:
+            return f"Unknown media types: {requested}", 400
+
+        chat_doc_ref = project_b_db.collection("chats").document(chatId)
+        deadline = deadline_in()
+
+        lookups = {
+            "chat": lambda: get_chat(chatId),
+            "query_vector": lambda: get_embedding(content, client),
+        }
+        for t in media_types:
+            lookups[f"has_{t}"] = lambda t=t: _has_records(t, chapterId)
+
+        stages = run_stages(
+            lookups,
+            deadline,
+            cancel_when={"chat": (lambda chat: chat is None, ALL_STAGES)},
+        )
+
+        if stages["chat"] is None:
+            return _chat_not_found(chatId)
+
+        # Fan out: one query per media index that has records for the chapter
+        with_records = [t for t in media_types if stages[f"has_{t}"]]
+        found = run_stages(
+            {
+                t: (lambda t=t: _find_matches(t, stages["query_vector"], chapterId, top_k=CURSOR_CANDIDATES, text=content))
+                for t in with_records
+            },
+            deadline,
+        )
+
+        writes = []
+        results = {}
+        written = 0
+        for t in media_types:
+            matches = found.get(t) or []
+            if not matches:
+                invalidate(chatId, t)
+                results[t] = {"found": False, "content": MEDIA_TYPES[t]["not_found"]}
+                continue
+
+            save_cursor(chatId, t, chapterId, matches)
+
+            description, url, score = _describe_match(t, matches[0])
+            message_data = _message(MEDIA_TYPES[t]["user_id"], description, url, location)
+            writes.append((_new_message_ref(chat_doc_ref, message_data), message_data))
+            results[t] = {"found": True, **_result(message_data, score)}
+            written += 1
+
+        if not written:
+            return _no_media_reply(media_types, chatId, chat_doc_ref, location)
+
+        # One commit for every message of this search
+        write_messages(project_b_db, writes)
+
+        return {
+            "message": f"{written} message(s) written to Firestore",
+            "results": results,
+        }, 200
+
+    except DependencyError as e:
+        # OpenAI / Pinecone too slow or unhealthy: answer right away as if nothing matched
+        logging.error(f"mediaSearch falling back: {e}")
+        if get_chat(chatId) is None:
+            return _chat_not_found(chatId)
+        return _no_media_reply(media_types, chatId, chat_doc_ref, location)
+
+    except StageTimeout as e:
+        logging.error(f"mediaSearch timed out: {e}")
+        return f"Error: {str(e)}", 504
+
+    except Exception as e:
+        logging.exception("Error during mediaSearch")
+        return f"Error: {str(e)}", 500
+
+
+def _no_media_reply(media_types: list, chatId: str, chat_doc_ref, location: str):
+    """Write the "Sorry, I don't have any media ..." message for a multi-modal search"""
+    results = {}
+    for t in media_types:
+        invalidate(chatId, t)
+        results[t] = {"found": False, "content": MEDIA_TYPES[t]["not_found"]}
+    message_data = _message(NO_MEDIA_USER_ID, NO_MEDIA_MESSAGE, None, location)
+    write_message(project_b_db, _new_message_ref(chat_doc_ref, message_data), message_data)
+    results["none"] = _result(message_data, 0.0)
+    return {"message": "1 message(s) written to Firestore", "results": results}, 200
+
+
+def _requested_types(data: dict):
+    requested = data.get("types") or list(MEDIA_TYPES)
+    return [t for t in MEDIA_TYPES if t in requested], requested
+
+
+def search_media_batch(data: dict):
+    """
+    Batch search for pre-generating tour content.
+    Payload: {"items": [{"content", "chapterId"}, ...], "types": [...], "topK": 1,
+              "write": false, "chatId": ..., "location": ...}
+    At most MAX_BATCH_ITEMS items; topK is clamped to 1..MAX_BATCH_TOP_K.
+    Every text is embedded in one list-input call, the Pinecone queries run with
+    bounded concurrency, and results come back in request order. Messages are only
+    written to chats/{chatId}/messages when "write" is true. Searches that hit an
+    unhealthy dependency come back as {"found": false, "degraded": true} instead of
+    failing the batch.
+    """
+    try:
+        if not data:
+            return "Invalid JSON payload", 400
+
+        items = data.get("items")
+        if not isinstance(items, list) or not items:
+            return "Missing 'items' list", 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return f"Too many items (max {MAX_BATCH_ITEMS})", 400
+        if any(
+            not isinstance(i, dict) or not isinstance(i.get("content"), str) or not i["content"].strip()
+            or not i.get("chapterId")
+            for i in items
+        ):
+            return "Each item needs 'content' and 'chapterId'", 400
+
+        media_types, requested = _requested_types(data)
+        if not media_types:
+            return f"Unknown media types: {requested}", 400
+
+        try:
+            top_k = int(data.get("topK") or 1)
+        except (TypeError, ValueError):
+            return "'topK' must be an integer", 400
+        top_k = min(max(top_k, 1), MAX_BATCH_TOP_K)
+        write = bool(data.get("write"))
+        chatId = data.get("chatId")
+        location = data.get("location") or ""
+        if write and not chatId:
+            return "'chatId' is required when 'write' is true", 400
+
+        deadline = deadline_in(BATCH_TIMEOUT_SECONDS)
+
+        chat_doc_ref = None
+        if write:
+            if not chat_exists(chatId):
+                return _chat_not_found(chatId)
+            chat_doc_ref = project_b_db.collection("chats").document(chatId)
+
+        # One embeddings call for every text that is not cached yet
+        try:
+            vectors = get_embeddings([i["content"] for i in items], client)
+        except DependencyError as e:
+            logging.error(f"mediaSearch batch falling back for every item: {e}")
+            vectors = None
+
+        def _search(task):
+            """Matches for one item and media type; None when a dependency is unhealthy"""
+            position, media_type = task
+            if vectors is None:
+                return None
+            chapterId = items[position]["chapterId"]
+            try:
+                if not _has_records(media_type, chapterId):
+                    return []
+                return _find_matches(media_type, vectors[position], chapterId, top_k=top_k, text=items[position]["content"])
+            except DependencyError as e:
+                logging.error(f"mediaSearch batch falling back for {media_type} of item {position}: {e}")
+                return None
+
+        tasks = [(position, t) for position in range(len(items)) for t in media_types]
+        pool = ThreadPoolExecutor(max_workers=BATCH_QUERY_CONCURRENCY, thread_name_prefix="batch-search")
+        try:
+            # Each task runs in a copy of this request's context (stage timings)
+            futures = [pool.submit(contextvars.copy_context().run, _search, task) for task in tasks]
+            found = {
+                task: future.result(timeout=max(deadline - time.monotonic(), 0))
+                for task, future in zip(tasks, futures)
+            }
+        except FuturesTimeout:
+            raise StageTimeout("Batch queries exceeded the deadline")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        results = []
+        pending_writes = []
+        for position, item in enumerate(items):
+            per_type = {}
+            for t in media_types:
+                matches = found[(position, t)]
+                if matches is None:
+                    per_type[t] = {"found": False, "degraded": True}
+                    continue
+                if not matches:
+                    per_type[t] = {"found": False}
+                    continue
+
+                description, url, score = _describe_match(t, matches[0])
+                result = {"found": True, "score": score, "content": description, "image_url": url}
+                if top_k > 1:
+                    result["candidates"] = [
+                        {"id": m["id"], "score": m["score"], "image_url": _describe_match(t, m)[1]}
+                        for m in matches
+                    ]
+
+                if write:
+                    message_data = _message(MEDIA_TYPES[t]["user_id"], description, url, location)
+                    pending_writes.append((_new_message_ref(chat_doc_ref, message_data), message_data))
+                    result["id"] = message_data["id"]
+
+                per_type[t] = result
+
+            results.append({"content": item["content"], "chapterId": item["chapterId"], "results": per_type})
+
+        write_messages(project_b_db, pending_writes)
+
+        return {"count": len(results), "written": len(pending_writes), "results": results}, 200
+
+    except StageTimeout as e:
+        logging.error(f"mediaSearch batch timed out: {e}")
+        return f"Error: {str(e)}", 504
+
+    except Exception as e:
+        logging.exception("Error during mediaSearch batch")
+        return f"Error: {str(e)}", 500
+
+
+@https_fn.on_request()
+@timed_request("searchMediaFromDatabase")
+def searchMediaFromDatabase(req: Request) -> https_fn.Response:
+    return to_response(*search_all_media(req.get_json(silent=True)))
+
+
+@https_fn.on_request()
+@timed_request("searchMediaBatch")
+def searchMediaBatch(req: Request) -> https_fn.Response:
+    return to_response(*search_media_batch(req.get_json(silent=True)))
@@ -5,6 +5,8 @@ from datetime import datetime
 import requests
 import math
 
+import http_session
+
 # If you want, you can move this to env later
 PROCESS_TEXT_URL = "https://ecostory-backend-36036911566.us-central1.run.app/process-text/"
 # ⬆️ change to /process_text or /process if that’s what you use in FastAPI
@@ -122,7 +124,7 @@ def on_message_created(event: firestore_fn.Event[firestore_fn.DocumentSnapshot])
         # 2️⃣ Avoid infinite loop: skip media/system assistant messages
         # ✅ NOTE: we REMOVED CustomerService from skip list because we WANT to notify for it
         logging.warning(f"🔎 Checking sender: '{sender_user_id}' (Role: {role})")
-        if sender_user_id in ("ImageG", "AudioG", "VideoG", "ErrorG"):
+        if sender_user_id in ("ImageG", "AudioG", "VideoG", "MediaG", "ErrorG"):
             logging.warning(f"⏭️ Skipping message from ignored sender: '{sender_user_id}'")
             return
 
@@ -652,7 +654,7 @@ def on_message_created(event: firestore_fn.Event[firestore_fn.DocumentSnapshot])
                     api_url = (
                         "https://us-central1-ecostory-b31b6.cloudfunctions.net/chatSuggestionData"
                     )
-                    response = requests.post(
+                    response = http_session.post(
                         api_url,
                         json=api_payload,
                         headers={"Content-Type": "application/json"},
@@ -706,7 +708,7 @@ def on_message_created(event: firestore_fn.Event[firestore_fn.DocumentSnapshot])
 
                     logging.info(f"📤 process-text payload: {process_payload}")
 
-                    response = requests.post(
+                    response = http_session.post(
                         PROCESS_TEXT_URL,
                         json=process_payload,
                         headers={"Content-Type": "application/json"},
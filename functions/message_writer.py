@@ -0,0 +1,135 @@
+# message_writer.py
+#
+# Writes of assistant messages into chats/{chatId}/messages for the search functions.
+# Message ids come from a client-side document() call, so the response never has to
+# wait for the commit. With MESSAGE_WRITE_BEHIND=1 writes are queued and committed by
+# background threads: retried with backoff, flushed when the instance shuts down,
+# and logged as errors (with the message payload) if they still fail. Otherwise they
+# are committed inline as before.
+#
+# Write-behind needs CPU after the response is sent: only enable it on functions
+# deployed with CPU always allocated.
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from dotenv import load_dotenv
+
+from firebase_setup import FIRESTORE_BATCH_LIMIT
+from request_timing import stage, register_stats
+
+load_dotenv(".env.dev")
+
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "0") == "1"
+MESSAGE_WRITE_RETRIES = int(os.getenv("MESSAGE_WRITE_RETRIES", "4"))
+MESSAGE_WRITE_BACKOFF_SECONDS = 0.25  # doubled after every failed attempt
+MESSAGE_WRITER_THREADS = int(os.getenv("MESSAGE_WRITER_THREADS", "4"))
+# How long shutdown waits for queued writes
+MESSAGE_FLUSH_TIMEOUT = float(os.getenv("MESSAGE_FLUSH_TIMEOUT", "8"))
+
+_queue = queue.Queue()
+_workers = []
+_workers_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"queued": 0, "written": 0, "retries": 0, "failed": 0}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _commit(db, writes: list) -> None:
+    """Commit (doc_ref, data) sets: a plain set for one, batches of FIRESTORE_BATCH_LIMIT otherwise"""
+    with stage("firestore_write"):
+        if len(writes) == 1:
+            doc_ref, data = writes[0]
+            doc_ref.set(data)
+            return
+
+        for start in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for doc_ref, data in writes[start:start + FIRESTORE_BATCH_LIMIT]:
+                batch.set(doc_ref, data)
+            batch.commit()
+
+
+def _commit_with_retries(db, writes: list) -> None:
+    # Every write is a set() of a known document, so a retry can never duplicate a message
+    delay = MESSAGE_WRITE_BACKOFF_SECONDS
+    for attempt in range(1, MESSAGE_WRITE_RETRIES + 1):
+        try:
+            _commit(db, writes)
+            _count("written", len(writes))
+            return
+        except Exception as e:
+            if attempt == MESSAGE_WRITE_RETRIES:
+                _count("failed", len(writes))
+                for doc_ref, data in writes:
+                    logging.error(
+                        f"[message_writer] Giving up on {doc_ref.path} after {attempt} attempts: {e} | message={data}"
+                    )
+                return
+            _count("retries")
+            time.sleep(delay)
+            delay *= 2
+
+
+def _work() -> None:
+    while True:
+        db, writes = _queue.get()
+        try:
+            _commit_with_retries(db, writes)
+        finally:
+            _queue.task_done()
+
+
+def _ensure_workers() -> None:
+    with _workers_lock:
+        while len(_workers) < MESSAGE_WRITER_THREADS:
+            worker = threading.Thread(target=_work, name=f"message-writer-{len(_workers)}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def write_messages(db, writes: list) -> None:
+    """
+    Persist assistant messages given as (doc_ref, message_data) pairs, all in one commit
+    (or as few batches as possible). Returns once queued in write-behind mode.
+    """
+    if not writes:
+        return
+    if not MESSAGE_WRITE_BEHIND:
+        _commit(db, writes)
+        return
+
+    _ensure_workers()
+    _count("queued", len(writes))
+    _queue.put((db, list(writes)))
+
+
+def write_message(db, doc_ref, message_data: dict) -> None:
+    write_messages(db, [(doc_ref, message_data)])
+
+
+def flush(timeout: float = None) -> bool:
+    """Wait for queued writes to finish; False if some were still pending at the timeout"""
+    timeout = MESSAGE_FLUSH_TIMEOUT if timeout is None else timeout
+    with _queue.all_tasks_done:
+        done = _queue.all_tasks_done.wait_for(lambda: not _queue.unfinished_tasks, timeout)
+    if not done:
+        logging.error(f"[message_writer] {_queue.unfinished_tasks} message write(s) still pending at shutdown")
+    return done
+
+
+def writer_stats() -> dict:
+    with _stats_lock:
+        return {**_stats, "pending": _queue.unfinished_tasks}
+
+
+atexit.register(flush)
+
+
+register_stats("message_writer", writer_stats)
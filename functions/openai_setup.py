@@ -1,8 +1,32 @@
 # openai_setup.py
+#
+# The process-wide OpenAI client. Every module uses this one instance, so
+# embeddings and completions share a single keep-alive connection pool.
 import os
+import httpx
 from openai import OpenAI
 from dotenv import load_dotenv
 
 load_dotenv(".env.dev")
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
\ No newline at end of file
+# Connections kept open to the OpenAI API
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_KEEPALIVE_CONNECTIONS", "16"))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "60"))
+# Retries (with the SDK's exponential backoff) on connection errors, 429 and 5xx
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=OPENAI_MAX_RETRIES,
+    timeout=OPENAI_TIMEOUT_SECONDS,
+    http_client=httpx.Client(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+        ),
+        timeout=OPENAI_TIMEOUT_SECONDS,
+    ),
+)
@@ -1,14 +1,73 @@
 # pinecone_setup.py
 import os
+import time
+import logging
+import threading
 from pinecone import Pinecone
 from dotenv import load_dotenv
 
 load_dotenv(".env.dev")
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")
+# Worker threads / connections kept open by each index handle
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "4"))
 
-if not PINECONE_INDEX_HOST:
-    raise EnvironmentError("Missing PINECONE_INDEX_HOST for serverless Pinecone setup")
+# Set PINECONE_WARMUP=1 to open the TLS connection of an index as soon as it is registered
+PINECONE_WARMUP = os.getenv("PINECONE_WARMUP", "0") == "1"
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
+_client = None
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_pinecone_client() -> Pinecone:
+    """Return the process-wide Pinecone client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return _client
+
+
+def get_index(name: str, host: str):
+    """
+    Return the shared Index handle for (name, host).
+    Handles are created lazily and kept for the life of the instance, so warm
+    requests reuse the already-open HTTP connections instead of a new TLS setup.
+    """
+    if not host:
+        raise EnvironmentError(f"Missing Pinecone host for index '{name}'")
+
+    key = (name, host)
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    pc = get_pinecone_client()
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            started = time.perf_counter()
+            index = pc.Index(name=name, host=host, pool_threads=PINECONE_POOL_THREADS)
+            _indexes[key] = index
+            logging.info(
+                f"[pinecone_setup] Opened index handle {name} "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+    return index
+
+
+def warm_index(name: str, host: str) -> None:
+    """If PINECONE_WARMUP is on, open the index handle now and prime its connection in the background"""
+    if not PINECONE_WARMUP or not name or not host:
+        return
+
+    index = get_index(name, host)
+
+    def _prime():
+        try:
+            index.describe_index_stats()
+        except Exception as e:
+            logging.warning(f"[pinecone_setup] Warm-up failed for {name}: {e}")
+
+    threading.Thread(target=_prime, daemon=True).start()
@@ -2,16 +2,27 @@ from firebase_functions import https_fn
 from firebase_functions.https_fn import Request
 import json
 import os
-from openai import OpenAI
+import re
+import time
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import requests
+
+from request_timing import timed_request, stage, register_stats
+from openai_setup import client
+import http_session
+import resilience
+from mediaSearch import search_media, prefetch_matches
+from intent_classifier import classify_all as classify_fast_path, rule_scores, local_intent_stats
+from embedding_cache import get_embedding, normalize_text
+from ttl_cache import TTLCache
+from result_cursor import is_follow_up
+from speculation import Speculation, SPECULATION_ENABLED, SPECULATIVE_PREFETCH_MAX, SPECULATIVE_MIN_SCORE
 
 # Load environment variables
 load_dotenv(".env.dev")
 
-# OpenAI setup
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Intent categories
 INTENTS = {
     "search_image": "searchImageFromDatabase",
@@ -19,7 +30,72 @@ INTENTS = {
     "search_video": "searchVideoFromDatabase"
 }
 
+# Media type each search intent looks up
+INTENT_MEDIA_TYPES = {
+    "search_image": "image",
+    "search_audio": "audio",
+    "search_video": "video",
+}
+
+# In-process handlers per intent: the engines behind the HTTP functions in INTENTS,
+# returning (body, status). A query embedding computed during classification and a
+# speculatively prefetched search are passed on.
+INTENT_HANDLERS = {
+    intent: lambda data, vector=None, prefetched=None, media_type=media_type: search_media(
+        media_type, data, query_vector=vector, prefetched=prefetched
+    )
+    for intent, media_type in INTENT_MEDIA_TYPES.items()
+}
+
+# "inprocess" calls INTENT_HANDLERS directly; "http" posts to the deployed functions
+INTENT_DISPATCH = os.getenv("INTENT_DISPATCH", "inprocess")
+INTENT_API_BASE_URL = os.getenv(
+    "INTENT_API_BASE_URL", "http://127.0.0.1:5001/ecostory-b31b6/us-central1"  # For local emulator
+)
+# INTENT_API_BASE_URL = "https://us-central1-ecostory-b31b6.cloudfunctions.net"  # For production
+INTENT_API_TIMEOUT_SECONDS = float(os.getenv("INTENT_API_TIMEOUT_SECONDS", "30"))
+
+# LLM intent classification
+INTENT_MODEL = "gpt-4.1-mini"
+INTENT_SYSTEM_PROMPT = "You are an intent classifier. Respond only with the category name."
+INTENT_PROMPT = """
+    Classify the following user text into one or more of these 5 categories:
+    
+    1. search_image - User wants to search for images
+    2. search_audio - User wants to search for audio files
+    3. search_video - User wants to search for videos
+    4. web_search - User wants to search the web for information
+    5. generate_image - User wants to generate/create a new image
+    
+    User text: "{user_text}"
+    
+    Respond with only the category name (e.g., "search_image"). If the user asks
+    for several things at once, list every category, separated by commas.
+    
+    Examples:
+    - "Show me pictures of India Gate" -> search_image
+    - "Find audio about Delhi" -> search_audio
+    - "Play video of Republic Day" -> search_video
+    - "What is the history of India Gate?" -> web_search
+    - "Create an image of a sunset" -> generate_image
+    - "Show me a photo and play the audio story of Qutub Minar" -> search_image, search_audio
+    """
+
+# LLM answers per normalized text. Keys carry a hash of the model and prompts, so
+# editing either starts a fresh cache instead of serving stale classifications.
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", str(24 * 3600)))
+INTENT_CACHE_MAX_ENTRIES = int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "20000"))
+INTENT_CACHE_VERSION = hashlib.sha1(
+    "\n".join((INTENT_MODEL, INTENT_SYSTEM_PROMPT, INTENT_PROMPT)).encode("utf-8")
+).hexdigest()[:12]
+_intent_cache = TTLCache(maxsize=INTENT_CACHE_MAX_ENTRIES, ttl=INTENT_CACHE_TTL, name="intent_cache")
+
+# Searches of a compound request ("a photo and the audio story") run concurrently
+INTENT_DISPATCH_THREADS = int(os.getenv("INTENT_DISPATCH_THREADS", "8"))
+_dispatch_pool = ThreadPoolExecutor(max_workers=INTENT_DISPATCH_THREADS, thread_name_prefix="intent-dispatch")
+
 @https_fn.on_request()
+@timed_request("process_text")
 def process_text(req: Request) -> https_fn.Response:
     try:
         data = req.get_json(silent=True)
@@ -30,16 +106,33 @@ def process_text(req: Request) -> https_fn.Response:
         if not user_text:
             return https_fn.Response("Missing 'text' parameter", status=400)
 
-        # Step 1: Get intent from OpenAI
-        intent = classify_intent(user_text)
-        
-        # Step 2: Call appropriate API based on intent
-        response = call_intent_api(intent, data)
+        # Embed the text and prefetch the likeliest searches while the intent is classified
+        speculation = start_speculation(data)
+        try:
+            # Step 1: Get intents (local fast paths first, OpenAI only when uncertain);
+            # a compound request asks for several
+            intents, query_vector = classify_intents(user_text, embed=speculation.vector if speculation else None)
+
+            # Step 2: Call the API of every intent concurrently, sharing the speculative
+            # work and one query embedding
+            prefetched = {intent: speculation.take(intent) for intent in intents} if speculation else {}
+            if query_vector is None and INTENT_DISPATCH != "http" and not all(prefetched.get(i) for i in intents):
+                query_vector = speculation.vector() if speculation else None
+                if query_vector is None and len(intents) > 1:
+                    query_vector = get_embedding(user_text, client)
+            results = dispatch_intents(intents, data, query_vector, prefetched)
+        finally:
+            if speculation:
+                speculation.close()
         
+        # "intent" / "response" describe the first intent, as for single requests
         return https_fn.Response(
             json.dumps({
-                "intent": intent,
-                "response": response
+                "intent": intents[0],
+                "response": results[intents[0]][0],
+                "intents": intents,
+                "responses": {intent: response for intent, (response, _) in results.items()},
+                "timings": {intent: round(ms, 1) for intent, (_, ms) in results.items()},
             }),
             status=200,
             content_type="application/json"
@@ -48,93 +141,160 @@ def process_text(req: Request) -> https_fn.Response:
     except Exception as e:
         return https_fn.Response(f"Error: {str(e)}", status=500)
 
-def classify_intent(user_text: str) -> str:
-    """Use OpenAI to classify the user's intent"""
-    
-    prompt = f"""
-    Classify the following user text into one of these 5 categories:
-    
-    1. search_image - User wants to search for images
-    2. search_audio - User wants to search for audio files
-    3. search_video - User wants to search for videos
-    4. web_search - User wants to search the web for information
-    5. generate_image - User wants to generate/create a new image
-    
-    User text: "{user_text}"
-    
-    Respond with only the category name (e.g., "search_image").
-    
-    Examples:
-    - "Show me pictures of India Gate" -> search_image
-    - "Find audio about Delhi" -> search_audio
-    - "Play video of Republic Day" -> search_video
-    - "What is the history of India Gate?" -> web_search
-    - "Create an image of a sunset" -> generate_image
+def start_speculation(data: dict):
+    """
+    Speculation embedding the request text and prefetching the searches of the intents
+    the intent cue scores rank highest; None when disabled or dispatching over HTTP.
+    """
+    if not SPECULATION_ENABLED or INTENT_DISPATCH == "http":
+        return None
+
+    user_text = data.get("text")
+    chapter_id = data.get("chapterId")
+    prefetchers = {}
+    # Follow-ups ("show me another one") are served from the result cursor
+    if chapter_id and not is_follow_up(user_text):
+        scores = rule_scores(user_text)
+        likely = sorted(INTENT_MEDIA_TYPES, key=scores.get, reverse=True)[:SPECULATIVE_PREFETCH_MAX]
+        for intent in likely:
+            if scores[intent] >= SPECULATIVE_MIN_SCORE:
+                prefetchers[intent] = lambda vector, media_type=INTENT_MEDIA_TYPES[intent]: prefetch_matches(
+                    media_type, vector, chapter_id, content=user_text
+                )
+
+    return Speculation(lambda: get_embedding(user_text, client), prefetchers)
+
+def _valid_intents(intents) -> list:
+    """Known intents in order without duplicates, or the default ["search_image"]"""
+    return list(dict.fromkeys(i for i in intents if i in INTENTS)) or ["search_image"]
+
+def classify_intents(user_text: str, embed=None):
+    """
+    Classify the user's intents locally when confident, otherwise with OpenAI.
+    Returns (intents, query_vector); intents has one entry unless the user asked for
+    several things at once. query_vector is the embedding of user_text if
+    classification needed it, else None. `embed` supplies that embedding if given.
     """
     
+    # Phrases the LLM has already classified (canned prompts, quick-reply chips)
+    cache_key = (INTENT_CACHE_VERSION, normalize_text(user_text))
+    cached = _intent_cache.get(cache_key)
+    if cached is not None:
+        return list(cached), None
+
+    # Fast path: obvious requests never reach the LLM
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an intent classifier. Respond only with the category name."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=50,
-            temperature=0.1
-        )
+        intents, query_vector = classify_fast_path(user_text, client, embed)
+    except Exception as e:
+        print(f"Error in local intent classification: {e}")
+        intents, query_vector = None, None
+    if intents:
+        return _valid_intents(intents), query_vector  # Same fallback as below
+
+    prompt = INTENT_PROMPT.format(user_text=user_text)
+    
+    try:
+        with stage("intent"):
+            response = resilience.call("openai_chat", lambda: client.chat.completions.create(
+                model=INTENT_MODEL,
+                messages=[
+                    {"role": "system", "content": INTENT_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=50,
+                temperature=0.1
+            ))
         
-        intent = response.choices[0].message.content.strip().lower()
+        intents = re.split(r"[\s,]+", response.choices[0].message.content.strip().lower())
         
-        # Validate intent
-        if intent in INTENTS:
-            return intent
-        else:
-            return "search_image"  # Default fallback
+        # Validate intents (unknown ones fall back to search_image)
+        intents = _valid_intents(intents)
+        _intent_cache.set(cache_key, tuple(intents))
+        return intents, query_vector
             
     except Exception as e:
         print(f"Error classifying intent: {e}")
-        return "search_image"  # Default fallback
+        return ["search_image"], query_vector  # Default fallback
+
+def intent_cache_stats() -> dict:
+    return {**_intent_cache.stats(), "version": INTENT_CACHE_VERSION}
+
+# Cached LLM answers next to the share the local fast path handles
+register_stats("intent", lambda: {"cache": intent_cache_stats(), "local": local_intent_stats()})
+
+def build_api_data(original_data: dict) -> dict:
+    """Payload the search functions expect, built from the process_text request"""
+    return {
+        "content": original_data.get("text", original_data.get("content", "")),
+        "chapterId": original_data.get("chapterId", ""),
+        "chatId": original_data.get("chatId", "default_chat_id"),  # Add this
+        "location": original_data.get("location", ""),
+        "lat": original_data.get("lat", 0),
+        "long": original_data.get("long", 0)
+    }
+
+def _failed_call(status: int, details: str, api_data: dict) -> dict:
+    return {
+        "error": f"API call failed with status {status}",
+        "details": details,
+        "sent_data": api_data
+    }
+
+def call_intent_api(intent: str, original_data: dict, query_vector=None, prefetched=None) -> dict:
+    """Run the search for the classified intent (in process, or over HTTP as a fallback)"""
+    api_data = build_api_data(original_data)
+    handler = INTENT_HANDLERS.get(intent)
+
+    if handler and INTENT_DISPATCH != "http":
+        try:
+            body, status = handler(api_data, query_vector, prefetched)
+        except Exception as e:
+            return {"error": f"Error calling API: {str(e)}"}
+
+        if status == 200:
+            return body
+        return _failed_call(status, body if isinstance(body, str) else json.dumps(body), api_data)
+
+    return call_intent_api_http(intent, api_data)
+
+def _timed_call(intent: str, original_data: dict, query_vector=None, prefetched=None):
+    started = time.perf_counter()
+    response = call_intent_api(intent, original_data, query_vector, prefetched)
+    return response, (time.perf_counter() - started) * 1000
+
+def dispatch_intents(intents: list, original_data: dict, query_vector=None, prefetched: dict = None) -> dict:
+    """{intent: (response, ms)} for every intent, the searches running concurrently"""
+    prefetched = prefetched or {}
+    if len(intents) == 1:
+        intent = intents[0]
+        return {intent: _timed_call(intent, original_data, query_vector, prefetched.get(intent))}
+
+    futures = {
+        intent: _dispatch_pool.submit(
+            contextvars.copy_context().run, _timed_call, intent, original_data, query_vector, prefetched.get(intent)
+        )
+        for intent in intents
+    }
+    return {intent: future.result() for intent, future in futures.items()}
+
+def call_intent_api_http(intent: str, api_data: dict) -> dict:
+    """Call the deployed function for the intent over HTTP"""
+    function_name = INTENTS.get(intent)
+    if not function_name:
+        return {"error": "Unknown intent"}
 
-def call_intent_api(intent: str, original_data: dict) -> dict:
-    """Call the appropriate API based on the classified intent"""
-    
-    base_url = "http://127.0.0.1:5001/ecostory-b31b6/us-central1"  # For local emulator
-    # base_url = "https://us-central1-ecostory-b31b6.cloudfunctions.net"  # For production
-    
     try:
-        # Transform data for the specific API
-        api_data = {
-            "content": original_data.get("text", original_data.get("content", "")),
-            "chapterId": original_data.get("chapterId", ""),
-            "chatId": original_data.get("chatId", "default_chat_id"),  # Add this
-            "location": original_data.get("location", ""),
-            "lat": original_data.get("lat", 0),
-            "long": original_data.get("long", 0)
-        }
-        
-        if intent == "search_image":
-            url = f"{base_url}/searchImageFromDatabase"
-            response = requests.post(url, json=api_data)
-            
-        elif intent == "search_audio":
-            url = f"{base_url}/searchAudioFromDatabase"
-            response = requests.post(url, json=api_data)
-            
-        elif intent == "search_video":
-            url = f"{base_url}/searchVideoFromDatabase"
-            response = requests.post(url, json=api_data)
-        
-        else:
-            return {"error": "Unknown intent"}
-        
+        with stage("http"):
+            response = http_session.post(
+                f"{INTENT_API_BASE_URL}/{function_name}",
+                json=api_data,
+                timeout=INTENT_API_TIMEOUT_SECONDS,
+            )
+
         if response.status_code == 200:
             return response.json()
         else:
-            return {
-                "error": f"API call failed with status {response.status_code}",
-                "details": response.text,
-                "sent_data": api_data
-            }
+            return _failed_call(response.status_code, response.text, api_data)
             
     except Exception as e:
-        return {"error": f"Error calling API: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Error calling API: {str(e)}"}
@@ -0,0 +1,194 @@
+# record_metadata.py
+#
+# Metadata side-store: the metadata of every Pinecone record (text, imageDesc,
+# imageURL, ...) kept by record id, so search queries can run with
+# include_metadata=False and only the ids a query returns are hydrated:
+#
+#   in-process cache -> Firestore (Project B) -> Pinecone fetch (written back)
+#
+#   recordMetadata/{indexName}/records/{recordId}
+#     - metadata, updatedAt
+#
+# The CLI writes entries on import/add and removes them on delete.
+import os
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from firebase_setup import get_project_b_firestore, FIRESTORE_BATCH_LIMIT
+from pinecone_setup import get_index
+from ttl_cache import TTLCache
+from request_timing import stage
+import resilience
+
+load_dotenv(".env.dev")
+
+RECORD_METADATA_COLLECTION = "recordMetadata"
+METADATA_SIDE_STORE_ENABLED = os.getenv("METADATA_SIDE_STORE_ENABLED", "1") == "1"
+RECORD_METADATA_TTL = float(os.getenv("RECORD_METADATA_TTL", "3600"))
+# Firestore copies older than this are re-fetched from Pinecone (catches edits made outside the CLI)
+RECORD_METADATA_MAX_AGE_HOURS = float(os.getenv("RECORD_METADATA_MAX_AGE_HOURS", "168"))
+
+FETCH_BATCH_SIZE = 100  # ids per Pinecone fetch
+
+_cache = TTLCache(maxsize=20000, ttl=RECORD_METADATA_TTL, name="record_metadata")
+_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="record-metadata")
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+
+def _is_fresh(updated_at) -> bool:
+    try:
+        updated = datetime.fromisoformat(str(updated_at).rstrip("Z"))
+    except ValueError:
+        return False
+    return datetime.utcnow() - updated <= timedelta(hours=RECORD_METADATA_MAX_AGE_HOURS)
+
+
+def _records(index_name: str):
+    db = get_project_b_firestore()
+    return db.collection(RECORD_METADATA_COLLECTION).document(index_name).collection("records")
+
+
+def _doc_id(record_id: str) -> str:
+    return quote(record_id, safe="")
+
+
+def remember(index_name: str, records: dict) -> None:
+    """Put {recordId: metadata} into the in-process cache only"""
+    for record_id, metadata in records.items():
+        _cache.set((index_name, record_id), metadata or {})
+
+
+def save_metadata(index_name: str, records: dict) -> int:
+    """Write {recordId: metadata} to the side-store"""
+    db = get_project_b_firestore()
+    col = _records(index_name)
+    items = list(records.items())
+    now = _now_iso()
+    for start in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for record_id, metadata in items[start:start + FIRESTORE_BATCH_LIMIT]:
+            batch.set(col.document(_doc_id(record_id)), {"metadata": metadata or {}, "updatedAt": now})
+        batch.commit()
+    remember(index_name, records)
+    return len(items)
+
+
+def delete_metadata(index_name: str, record_ids) -> int:
+    """Remove deleted records from the side-store"""
+    db = get_project_b_firestore()
+    col = _records(index_name)
+    record_ids = list(record_ids)
+    for start in range(0, len(record_ids), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for record_id in record_ids[start:start + FIRESTORE_BATCH_LIMIT]:
+            batch.delete(col.document(_doc_id(record_id)))
+            _cache.pop((index_name, record_id))
+        batch.commit()
+    return len(record_ids)
+
+
+def _save_in_background(index_name: str, records: dict) -> None:
+    try:
+        save_metadata(index_name, records)
+    except Exception as e:
+        logging.warning(f"[record_metadata] Write-back to {index_name} failed: {e}")
+
+
+def _load_from_store(index_name: str, record_ids: list) -> dict:
+    col = _records(index_name)
+    by_doc_id = {_doc_id(r): r for r in record_ids}
+    found = {}
+    with stage("firestore_read"):
+        docs = list(get_project_b_firestore().get_all([col.document(d) for d in by_doc_id]))
+    for doc in docs:
+        if not doc.exists:
+            continue
+        data = doc.to_dict() or {}
+        if _is_fresh(data.get("updatedAt")):
+            found[by_doc_id[doc.id]] = data.get("metadata") or {}
+    return found
+
+
+def _fetch_from_pinecone(index_name: str, index_host: str, record_ids: list) -> dict:
+    index = get_index(index_name, index_host)
+    found = {}
+    for start in range(0, len(record_ids), FETCH_BATCH_SIZE):
+        ids = record_ids[start:start + FETCH_BATCH_SIZE]
+        with stage("pinecone_fetch"):
+            result = resilience.call("pinecone_fetch", lambda: index.fetch(ids=ids))
+        for record_id, vector_data in (result.get("vectors") or {}).items():
+            found[record_id] = vector_data.get("metadata") or {}
+    return found
+
+
+def get_metadata(index_name: str, index_host: str, record_ids) -> dict:
+    """{recordId: metadata} for the given ids (ids unknown to Pinecone are left out)"""
+    found = {}
+    missing = []
+    for record_id in dict.fromkeys(record_ids):
+        metadata = _cache.get((index_name, record_id))
+        if metadata is None:
+            missing.append(record_id)
+        else:
+            found[record_id] = metadata
+
+    if missing:
+        try:
+            stored = _load_from_store(index_name, missing)
+        except Exception as e:
+            logging.warning(f"[record_metadata] Read from {index_name} failed: {e}")
+            stored = {}
+        remember(index_name, stored)
+        found.update(stored)
+        missing = [r for r in missing if r not in stored]
+
+    if missing:
+        fetched = _fetch_from_pinecone(index_name, index_host, missing)
+        remember(index_name, fetched)
+        found.update(fetched)
+        if fetched:
+            _writer.submit(_save_in_background, index_name, fetched)
+
+    return found
+
+
+def query_matches(index_name: str, index_host: str, vector, top_k: int, filter: dict, min_score: float = None) -> list:
+    """
+    index.query(...) returning Pinecone-shaped matches ({id, score, metadata}), best first.
+    Runs with include_metadata=False and hydrates only the returned ids (those at or
+    above `min_score` when given) from the side-store.
+    """
+    index = get_index(index_name, index_host)
+    if not METADATA_SIDE_STORE_ENABLED:
+        with stage("pinecone"):
+            resp = resilience.call(
+                "pinecone_query",
+                lambda: index.query(vector=vector, top_k=top_k, filter=filter, include_metadata=True),
+            )
+        matches = resp.get("matches", [])
+        return [m for m in matches if min_score is None or m.get("score", 0) >= min_score]
+
+    with stage("pinecone"):
+        resp = resilience.call(
+            "pinecone_query",
+            lambda: index.query(vector=vector, top_k=top_k, filter=filter, include_metadata=False),
+        )
+    matches = [
+        {"id": m["id"], "score": m["score"]}
+        for m in resp.get("matches", [])
+        if min_score is None or m["score"] >= min_score
+    ]
+    metadata = get_metadata(index_name, index_host, [m["id"] for m in matches]) if matches else {}
+    for m in matches:
+        m["metadata"] = dict(metadata.get(m["id"]) or {})
+    return matches
+
+
+def record_metadata_stats() -> dict:
+    return _cache.stats()
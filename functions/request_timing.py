@@ -0,0 +1,166 @@
+# request_timing.py
+#
+# Per-request stage timings for the HTTP functions. A handler decorated with
+# @timed_request(...) gets a Server-Timing response header and one structured log
+# line per request; the I/O helpers wrap their calls in `with stage("..."):`.
+#
+# Stage names: embed, pinecone, pinecone_fetch, local_search, firestore_read,
+# firestore_write, intent, http. Timings follow the request through the stage pool
+# via contextvars; outside a timed request (or with REQUEST_TIMING_ENABLED=0)
+# stage() is a shared no-op.
+#
+# Modules with instance-wide counters (cache hit rates, breaker state, ...) add them
+# with register_stats(); every REQUEST_STATS_LOG_EVERY timed requests they are
+# logged together as one "instance_stats" line.
+import os
+import json
+import time
+import threading
+import functools
+import contextvars
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "1") == "1"
+# 0 disables the instance_stats line
+REQUEST_STATS_LOG_EVERY = int(os.getenv("REQUEST_STATS_LOG_EVERY", "100"))
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+_stats_providers = {}  # name -> fn() returning a JSON-serializable dict
+_stats_lock = threading.Lock()
+_requests = 0
+
+
+class RequestTiming:
+    """Accumulated duration and call count per stage for one request"""
+
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.started = time.perf_counter()
+        self.stages = {}  # name -> [total ms, count]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += ms
+            entry[1] += 1
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self, total_ms: float) -> str:
+        with self._lock:
+            parts = [f"{name};dur={ms:.1f}" for name, (ms, _) in self.stages.items()]
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+    def log(self, status, total_ms: float) -> None:
+        with self._lock:
+            stages = {name: {"ms": round(ms, 1), "count": n} for name, (ms, n) in self.stages.items()}
+        # One JSON line on stdout = one structured Cloud Logging entry
+        print(json.dumps({
+            "severity": "INFO",
+            "message": f"{self.function_name} {status} in {total_ms:.0f} ms",
+            "event": "request_timing",
+            "function": self.function_name,
+            "status": status,
+            "total_ms": round(total_ms, 1),
+            "stages": stages,
+        }))
+
+
+class _Stage:
+    __slots__ = ("timing", "name", "started")
+
+    def __init__(self, timing: RequestTiming, name: str):
+        self.timing = timing
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timing.add(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """Context manager timing one stage of the current request (no-op outside one)"""
+    timing = _current.get()
+    return _NO_STAGE if timing is None else _Stage(timing, name)
+
+
+def register_stats(name: str, fn) -> None:
+    """Include fn() under `name` in the periodic instance_stats log line"""
+    _stats_providers[name] = fn
+
+
+def log_stats() -> None:
+    """Log the counters of every registered module as one structured line"""
+    stats = {}
+    for name, fn in list(_stats_providers.items()):
+        try:
+            stats[name] = fn()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    print(json.dumps({
+        "severity": "INFO",
+        "message": f"instance stats after {_requests} requests",
+        "event": "instance_stats",
+        "requests": _requests,
+        "stats": stats,
+    }, default=str))
+
+
+def _count_request() -> None:
+    global _requests
+    with _stats_lock:
+        _requests += 1
+        due = REQUEST_STATS_LOG_EVERY > 0 and _requests % REQUEST_STATS_LOG_EVERY == 0
+    if due:
+        log_stats()
+
+
+def timed_request(function_name: str):
+    """Decorator for an HTTP handler: time the request, add Server-Timing, log the stages"""
+    def decorator(handler):
+        if not REQUEST_TIMING_ENABLED:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            timing = RequestTiming(function_name)
+            token = _current.set(timing)
+            response = None
+            try:
+                response = handler(*args, **kwargs)
+                return response
+            finally:
+                _current.reset(token)
+                total_ms = timing.total_ms()
+                headers = getattr(response, "headers", None)
+                if headers is not None:
+                    headers["Server-Timing"] = timing.header(total_ms)
+                timing.log(getattr(response, "status_code", 500), total_ms)
+                _count_request()
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,241 @@
+# resilience.py
+#
+# Deadlines, hedged attempts and circuit breakers for the calls to OpenAI and
+# Pinecone. call(dependency, fn) runs fn on a small pool and:
+#
+#   - gives up after the dependency's deadline (DependencyTimeout)
+#   - for idempotent reads, starts a second attempt once the first has run longer
+#     than the p95 of recent successful calls, and takes whichever finishes first
+#   - after BREAKER_FAILURE_THRESHOLD consecutive failures opens the dependency's
+#     circuit: calls fail fast (DependencyUnavailable) for BREAKER_OPEN_SECONDS, then
+#     a single trial call decides whether it closes again
+#
+# Only outages count as failures: timeouts, connection errors, 429 and 5xx. A client
+# error (an OpenAI 400, a bad Pinecone filter) is raised to the caller as is and, being
+# an answer from the dependency, resets the count like a success.
+#
+# The search functions turn a DependencyError into their "Sorry, I don't have ..."
+# answer instead of a 500. Per-dependency counters (hedges fired/won, circuit state)
+# go into the periodic instance_stats log line.
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+from request_timing import register_stats
+
+load_dotenv(".env.dev")
+
+RESILIENCE_ENABLED = os.getenv("RESILIENCE_ENABLED", "1") == "1"
+
+# Per-dependency deadline in seconds
+DEPENDENCY_DEADLINES = {
+    "openai_embed": float(os.getenv("OPENAI_EMBED_DEADLINE_SECONDS", "8")),
+    "openai_chat": float(os.getenv("OPENAI_CHAT_DEADLINE_SECONDS", "10")),
+    "pinecone_query": float(os.getenv("PINECONE_QUERY_DEADLINE_SECONDS", "5")),
+    "pinecone_fetch": float(os.getenv("PINECONE_FETCH_DEADLINE_SECONDS", "5")),
+    # Whole-chapter listings (catalog refresh, local engine load)
+    "pinecone_list": float(os.getenv("PINECONE_LIST_DEADLINE_SECONDS", "30")),
+}
+# Reads that may be sent twice (completions are never hedged)
+HEDGED_DEPENDENCIES = {"openai_embed", "pinecone_query", "pinecone_fetch"}
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "1") == "1"
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+# No hedging until this many latencies have been seen
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+RESILIENCE_POOL_SIZE = int(os.getenv("RESILIENCE_POOL_SIZE", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=RESILIENCE_POOL_SIZE, thread_name_prefix="dependency")
+
+# Transport errors of the SDKs' HTTP stacks (openai/httpx, pinecone/urllib3), which
+# carry no status code
+_TRANSPORT_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "TimeoutException", "TransportError",
+    "MaxRetryError", "ProtocolError", "NewConnectionError", "ConnectTimeoutError", "ReadTimeoutError",
+}
+
+
+class DependencyError(Exception):
+    """A dependency did not answer usefully in time"""
+
+
+class DependencyTimeout(DependencyError):
+    """No attempt finished before the dependency's deadline"""
+
+
+class DependencyUnavailable(DependencyError):
+    """The dependency's circuit is open"""
+
+
+class _Dependency:
+    def __init__(self, name: str):
+        self.name = name
+        self.deadline = DEPENDENCY_DEADLINES.get(name, 10.0)
+        self.hedged = name in HEDGED_DEPENDENCIES
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0  # consecutive
+        self.open_until = 0.0
+        self.trial_running = False
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "client_errors": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+            "hedges_fired": 0,
+            "hedges_won": 0,
+            "circuit_opened": 0,
+        }
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+    def hedge_delay(self):
+        """Seconds after which a second attempt is sent, or None"""
+        if not (HEDGING_ENABLED and self.hedged):
+            return None
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        p95 = ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)]
+        return max(p95, HEDGE_MIN_DELAY_MS / 1000)
+
+    def allow(self) -> bool:
+        """False while the circuit is open; once it expires, one trial call at a time is let through"""
+        with self.lock:
+            if self.failures < BREAKER_FAILURE_THRESHOLD:
+                return True
+            if time.monotonic() < self.open_until or self.trial_running:
+                self.stats["short_circuited"] += 1
+                return False
+            self.trial_running = True
+            return True
+
+    def succeeded(self, seconds=None) -> None:
+        """The dependency answered; `seconds` is None for an error answer (no latency sample)"""
+        with self.lock:
+            if seconds is None:
+                self.stats["client_errors"] += 1
+            else:
+                self.latencies.append(seconds)
+            if self.failures >= BREAKER_FAILURE_THRESHOLD:
+                logging.info(f"[resilience] {self.name} circuit closed")
+            self.failures = 0
+            self.trial_running = False
+
+    def failed(self, timed_out: bool) -> None:
+        with self.lock:
+            self.stats["timeouts" if timed_out else "failures"] += 1
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= BREAKER_FAILURE_THRESHOLD:
+                if self.open_until <= time.monotonic():
+                    self.stats["circuit_opened"] += 1
+                    logging.error(
+                        f"[resilience] {self.name} circuit open for {BREAKER_OPEN_SECONDS:.0f} s "
+                        f"after {self.failures} consecutive failures"
+                    )
+                self.open_until = time.monotonic() + BREAKER_OPEN_SECONDS
+
+
+def is_outage(error: BaseException) -> bool:
+    """True for errors that say the dependency is down or overloaded rather than the request is wrong"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # openai APIStatusError.status_code, pinecone PineconeApiException.status
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(error).__mro__)
+
+
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+
+def _dependency(name: str) -> _Dependency:
+    dependency = _dependencies.get(name)
+    if dependency is None:
+        with _dependencies_lock:
+            dependency = _dependencies.setdefault(name, _Dependency(name))
+    return dependency
+
+
+def call(name: str, fn):
+    """fn() under the deadline, hedging and circuit breaker of dependency `name`"""
+    if not RESILIENCE_ENABLED:
+        return fn()
+
+    dependency = _dependency(name)
+    if not dependency.allow():
+        raise DependencyUnavailable(f"{name} is unavailable (circuit open)")
+    dependency.count("calls")
+
+    started = time.monotonic()
+    deadline = started + dependency.deadline
+    hedge_delay = dependency.hedge_delay()
+
+    # Attempts run in a copy of the caller's context (request stage timings)
+    attempts = {_executor.submit(contextvars.copy_context().run, fn): started}
+    pending = set(attempts)
+    error = None
+
+    while pending:
+        wait_until = deadline
+        if hedge_delay is not None and len(attempts) == 1:
+            wait_until = min(deadline, started + hedge_delay)
+        done, pending = wait(pending, timeout=max(wait_until - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if len(attempts) > 1 and attempts[future] > started:
+                dependency.count("hedges_won")
+            dependency.succeeded(time.monotonic() - attempts[future])
+            return result
+
+        if not done:
+            if time.monotonic() >= deadline:
+                break
+            if len(attempts) == 1:
+                dependency.count("hedges_fired")
+                hedge = _executor.submit(contextvars.copy_context().run, fn)
+                attempts[hedge] = time.monotonic()
+                pending.add(hedge)
+
+    if pending:
+        dependency.failed(timed_out=True)
+        raise DependencyTimeout(f"{name} did not answer within {dependency.deadline:.1f} s")
+    if is_outage(error):
+        dependency.failed(timed_out=False)
+    else:
+        dependency.succeeded()
+    raise error
+
+
+def resilience_stats() -> dict:
+    stats = {}
+    for name, dependency in list(_dependencies.items()):
+        with dependency.lock:
+            state = "open" if dependency.failures >= BREAKER_FAILURE_THRESHOLD else "closed"
+            stats[name] = {**dependency.stats, "circuit": state}
+    return stats
+
+
+register_stats("resilience", resilience_stats)
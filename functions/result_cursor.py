@@ -0,0 +1,90 @@
+# result_cursor.py
+#
+# Short-lived per-chat result cursors for the media searches. A search keeps its
+# ranked candidate list per (chatId, media type); follow-ups such as "show me
+# another one" are served from it without an embedding or a Pinecone query.
+# A cursor is dropped when it expires, runs out, or the chat moves to another chapter.
+import os
+import re
+import threading
+from dotenv import load_dotenv
+
+from ttl_cache import TTLCache
+
+load_dotenv(".env.dev")
+
+# Candidates fetched per fresh search (the first is served immediately)
+CURSOR_CANDIDATES = int(os.getenv("CURSOR_CANDIDATES", "10"))
+CURSOR_TTL_SECONDS = float(os.getenv("CURSOR_TTL_SECONDS", "600"))
+
+_cursors = TTLCache(maxsize=5000, ttl=CURSOR_TTL_SECONDS, name="result_cursor")
+_lock = threading.Lock()
+
+# Short "give me the next one" requests (English + Hinglish/Hindi)
+_FOLLOW_UP_PATTERNS = [
+    re.compile(
+        r"^\s*(please\s+)?((show|give|send|play|find)\s+(me\s+)?)?"
+        r"(another|one\s+more|the\s+next|next|more|a\s+different|something\s+else)"
+        r"(\s+(one|image|picture|photo|pic|video|clip|audio|story|song))?s?"
+        r"(\s+(please|pls|plz))?\s*[.!?]*\s*$",
+        re.IGNORECASE,
+    ),
+    # The whole message must be "<another> [media] [show/send] [please]", so
+    # "aur ek baat batao ..." or "doosri jagah ki photo" start a new search
+    re.compile(
+        r"^\s*(ek\s+aur|aur\s+ek|dusr[aie]|doosr[aie]|agl[aie]|next|aur(?=\s+\S))"
+        r"(\s+(photo|pic|image|tasveer|tasvir|video|clip|audio|kahani|story|gaana))?"
+        r"(\s+(wala|wali|waala|waali))?"
+        r"(\s+(dikhao|dikhaiye|dikha\s+do|bhejo|bhej\s+do|sunao|chalao|do|de\s+do))?"
+        r"(\s+(na|please|pls|plz))?\s*[.!?]*\s*$",
+        re.IGNORECASE,
+    ),
+    re.compile(
+        r"^\s*(एक\s+और|और\s+एक|दूसर[ाीे]|अगल[ाीे]|और(?=\s+\S))"
+        r"(\s+(फोटो|तस्वीर|वीडियो|ऑडियो|कहानी|गाना))?"
+        r"(\s+(वाला|वाली))?"
+        r"(\s+(दिखाओ|दिखाइए|दिखा\s+दो|भेजो|सुनाओ|चलाओ|दो))?"
+        r"(\s+(ना|प्लीज़|प्लीज))?\s*[.!?।]*\s*$"
+    ),
+]
+
+
+def is_follow_up(text: str) -> bool:
+    """True for short requests that only ask for the next result of the previous search"""
+    text = (text or "").strip()
+    if not text or len(text) > 60:
+        return False
+    return any(p.search(text) for p in _FOLLOW_UP_PATTERNS)
+
+
+def save_cursor(chat_id: str, media_type: str, chapter_id: str, matches: list) -> None:
+    """Remember the ranked candidates of a fresh search; the first one has already been served"""
+    if len(matches) <= 1:
+        _cursors.pop((chat_id, media_type))
+        return
+    _cursors.set((chat_id, media_type), {"chapterId": chapter_id, "matches": matches, "position": 1})
+
+
+def next_from_cursor(chat_id: str, media_type: str, chapter_id: str):
+    """Next unserved candidate for this chat, or None if there is no usable cursor"""
+    key = (chat_id, media_type)
+    with _lock:
+        cursor = _cursors.get(key)
+        if cursor is None:
+            return None
+
+        if cursor["chapterId"] != chapter_id or cursor["position"] >= len(cursor["matches"]):
+            _cursors.pop(key)
+            return None
+
+        match = cursor["matches"][cursor["position"]]
+        cursor["position"] += 1
+        return match
+
+
+def invalidate(chat_id: str, media_type: str) -> None:
+    _cursors.pop((chat_id, media_type))
+
+
+def cursor_stats() -> dict:
+    return _cursors.stats()
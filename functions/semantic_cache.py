@@ -0,0 +1,125 @@
+# semantic_cache.py
+#
+# Near-duplicate query cache: per (scope, chapterId) we keep the vectors of recent
+# queries and the Pinecone matches they produced. A new query whose cosine
+# similarity to a cached one reaches SEMANTIC_CACHE_THRESHOLD reuses those matches,
+# so paraphrases ("pictures of India Gate" / "India Gate photos") skip Pinecone.
+# Scopes are the media types and "chatSuggestionData". Each chapter's ring belongs
+# to one catalog version; a query under a new version (the chapter was re-exported)
+# drops the ring instead of serving matches of the old records.
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+# Recent queries remembered per (scope, chapter); the oldest is overwritten first
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "64"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "900"))
+SEMANTIC_CACHE_MAX_CHAPTERS = int(os.getenv("SEMANTIC_CACHE_MAX_CHAPTERS", "512"))
+# Log the hit rate every N lookups
+SEMANTIC_CACHE_LOG_EVERY = 100
+
+
+class _ChapterEntries:
+    """Fixed-size ring buffer of unit query vectors + their results for one chapter"""
+
+    def __init__(self, dim: int, version):
+        self.version = version
+        self.vectors = np.zeros((SEMANTIC_CACHE_SIZE, dim), dtype=np.float32)
+        self.expires = np.zeros(SEMANTIC_CACHE_SIZE, dtype=np.float64)
+        self.results = [None] * SEMANTIC_CACHE_SIZE
+        self.next_slot = 0
+
+    def lookup(self, unit: np.ndarray, now: float):
+        live = self.expires > now
+        if not live.any():
+            return None, 0.0
+        sims = self.vectors @ unit
+        sims[~live] = -1.0
+        best = int(np.argmax(sims))
+        return self.results[best], float(sims[best])
+
+    def add(self, unit: np.ndarray, result, now: float) -> None:
+        slot = self.next_slot
+        self.vectors[slot] = unit
+        self.expires[slot] = now + SEMANTIC_CACHE_TTL
+        self.results[slot] = result
+        self.next_slot = (slot + 1) % SEMANTIC_CACHE_SIZE
+
+
+_chapters = OrderedDict()  # (scope, chapterId) -> _ChapterEntries
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+def _record(hit: bool) -> None:
+    _stats["hits" if hit else "misses"] += 1
+    total = _stats["hits"] + _stats["misses"]
+    if total % SEMANTIC_CACHE_LOG_EVERY == 0:
+        logging.info(
+            f"[semantic_cache] {total} lookups, hit rate {_stats['hits'] / total:.1%}"
+        )
+
+
+def lookup(scope: str, chapter_id: str, vector, version=None):
+    """Cached result of a near-identical earlier query under the chapter's catalog `version`, or None"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+
+    unit = _unit(vector)
+    with _lock:
+        key = (scope, chapter_id)
+        entries = _chapters.get(key)
+        if entries is not None and entries.version != version:
+            del _chapters[key]
+            entries = None
+        if entries is None or entries.vectors.shape[1] != unit.shape[0]:
+            _record(False)
+            return None
+
+        _chapters.move_to_end(key)
+        result, similarity = entries.lookup(unit, time.monotonic())
+        hit = result is not None and similarity >= SEMANTIC_CACHE_THRESHOLD
+        _record(hit)
+        return result if hit else None
+
+
+def store(scope: str, chapter_id: str, vector, result, version=None) -> None:
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+
+    unit = _unit(vector)
+    with _lock:
+        key = (scope, chapter_id)
+        entries = _chapters.get(key)
+        if entries is None or entries.version != version or entries.vectors.shape[1] != unit.shape[0]:
+            entries = _ChapterEntries(unit.shape[0], version)
+            _chapters[key] = entries
+        _chapters.move_to_end(key)
+        entries.add(unit, result, time.monotonic())
+
+        while len(_chapters) > SEMANTIC_CACHE_MAX_CHAPTERS:
+            _chapters.popitem(last=False)
+
+
+def semantic_cache_stats() -> dict:
+    with _lock:
+        total = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_rate": round(_stats["hits"] / total, 4) if total else 0.0,
+            "chapters": len(_chapters),
+        }
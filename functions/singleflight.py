@@ -0,0 +1,68 @@
+# singleflight.py
+#
+# Coalesces identical in-flight work on one instance: while a call for a key is
+# running, concurrent callers with the same key wait for it and share its result
+# (or its exception) instead of repeating it. Nothing is kept once the call ends;
+# caching is left to the caches behind the call.
+#
+# Used for the embed + query path of the searches, keyed by
+# (operation, chapterId, normalized text), so a tour group sending the same
+# question at the same moment costs one embedding and one vector query.
+# Shared results must be treated as read-only by the callers.
+import os
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+
+from request_timing import register_stats
+
+load_dotenv(".env.dev")
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+
+_lock = threading.Lock()
+_inflight = {}  # key -> Future of the running call
+_stats = {"calls": 0, "shared": 0}
+
+
+def do(key, fn):
+    """fn(), or the result of the identical call already running for `key`"""
+    if not SINGLEFLIGHT_ENABLED:
+        return fn()
+
+    with _lock:
+        _stats["calls"] += 1
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+        else:
+            _stats["shared"] += 1
+
+    if not leader:
+        return future.result()
+
+    try:
+        result = fn()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def singleflight_stats() -> dict:
+    with _lock:
+        calls = _stats["calls"]
+        return {
+            **_stats,
+            "in_flight": len(_inflight),
+            "shared_rate": round(_stats["shared"] / calls, 4) if calls else 0.0,
+        }
+
+
+register_stats("singleflight", singleflight_stats)
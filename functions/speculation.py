@@ -0,0 +1,159 @@
+# speculation.py
+#
+# Speculative work for process_text: while the intent is still being classified,
+# the query embedding is computed and the searches of the likeliest intents are
+# prefetched. The caller takes the branch the classifier picked and closes the
+# speculation; branches that have not started are cancelled, the ones already
+# running finish in the background and are counted as wasted.
+#
+# Speculative tasks run on their own small pool (never on the stage pool that
+# waits for them) and SPECULATIVE_MAX_INFLIGHT caps them across the instance:
+# beyond it, speculation is skipped and the request runs serially as before.
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "1") == "1"
+# Searches prefetched per request (0 = only the embedding is speculative)
+SPECULATIVE_PREFETCH_MAX = int(os.getenv("SPECULATIVE_PREFETCH_MAX", "2"))
+# Intents whose cue score (intent_classifier.rule_scores) is below this are not prefetched
+SPECULATIVE_MIN_SCORE = float(os.getenv("SPECULATIVE_MIN_SCORE", "0.2"))
+# Speculative tasks queued or running across the instance
+SPECULATIVE_MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", "16"))
+# Log the wasted share every N speculations
+SPECULATION_LOG_EVERY = 100
+
+_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_INFLIGHT, thread_name_prefix="speculation")
+_inflight = threading.BoundedSemaphore(SPECULATIVE_MAX_INFLIGHT)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "embeddings": 0,
+    "prefetches": 0,
+    "used": 0,
+    "cancelled": 0,
+    "wasted": 0,
+    "skipped": 0,
+    "wasted_ms": 0.0,
+}
+
+
+def _count(name: str, n=1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+        if name == "requests" and _stats["requests"] % SPECULATION_LOG_EVERY == 0:
+            logging.info(
+                f"[speculation] {_stats['requests']} requests, {_stats['prefetches']} prefetches, "
+                f"{_stats['used']} used, {_stats['wasted']} wasted ({_stats['wasted_ms']:.0f} ms)"
+            )
+
+
+def _run(future: Future, fn, *args) -> None:
+    """Run fn into a placeholder future unless it was cancelled while queued"""
+    try:
+        if not future.set_running_or_notify_cancel():
+            return
+        start = time.monotonic()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            future.elapsed_ms = (time.monotonic() - start) * 1000
+            future.set_exception(e)
+        else:
+            future.elapsed_ms = (time.monotonic() - start) * 1000
+            future.set_result(result)
+    finally:
+        _inflight.release()
+
+
+def _submit(fn, *args):
+    """Placeholder future for fn on the speculation pool, or None when over the cap"""
+    if not _inflight.acquire(blocking=False):
+        _count("skipped")
+        return None
+    future = Future()
+    _executor.submit(contextvars.copy_context().run, _run, future, fn, *args)
+    return future
+
+
+class Speculation:
+    """
+    Embedding of the request text plus {key: fn(vector)} prefetches started up front.
+    vector() and take(key) hand out the speculative results; close() drops the rest.
+    """
+
+    def __init__(self, embed, prefetchers: dict):
+        self._lock = threading.Lock()
+        self._closed = False
+        self._taken = set()
+        self._prefetches = {key: Future() for key in prefetchers}
+        _count("requests")
+
+        self._embedding = _submit(embed)
+        if self._embedding is None:
+            for future in self._prefetches.values():
+                future.cancel()
+            return
+        _count("embeddings")
+        self._embedding.add_done_callback(lambda f: self._start_prefetches(f, prefetchers))
+
+    def _start_prefetches(self, embedding: Future, prefetchers: dict) -> None:
+        vector = None if embedding.cancelled() or embedding.exception() else embedding.result()
+        for key, fn in prefetchers.items():
+            placeholder = self._prefetches[key]
+            with self._lock:
+                started = vector is not None and not self._closed and _inflight.acquire(blocking=False)
+            if not started:
+                if vector is not None and not self._closed:
+                    _count("skipped")
+                placeholder.cancel()
+                continue
+            _count("prefetches")
+            # _run releases the slot acquired above
+            _executor.submit(contextvars.copy_context().run, _run, placeholder, fn, vector)
+
+    def vector(self):
+        """The speculative query embedding (waits for it), or None if it was skipped or failed"""
+        if self._embedding is None:
+            return None
+        try:
+            return self._embedding.result()
+        except Exception as e:
+            logging.warning(f"[speculation] Query embedding failed: {e}")
+            return None
+
+    def take(self, key):
+        """Future of the prefetch for `key` (kept by close()), or None if there is none"""
+        future = self._prefetches.get(key)
+        if future is None or future.cancelled():
+            return None
+        with self._lock:
+            self._taken.add(key)
+        _count("used")
+        return future
+
+    def close(self) -> None:
+        """Cancel the prefetches nobody took; running ones are left to finish and counted as wasted"""
+        with self._lock:
+            self._closed = True
+            untaken = [
+                f for key, f in self._prefetches.items() if key not in self._taken and not f.cancelled()
+            ]
+        for future in untaken:
+            if future.cancel():
+                _count("cancelled")
+            elif future.running() or future.done():
+                _count("wasted")
+                future.add_done_callback(lambda f: _count("wasted_ms", getattr(f, "elapsed_ms", 0.0)))
+
+
+def speculation_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,79 @@
+# stage_runner.py
+#
+# Runs the independent I/O stages of a request (Firestore reads, embeddings,
+# vector queries) concurrently on a shared thread pool under one deadline.
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+load_dotenv(".env.dev")
+
+STAGE_POOL_SIZE = int(os.getenv("STAGE_POOL_SIZE", "16"))
+# Combined budget for all stages of one search request
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "20"))
+
+ALL_STAGES = "*"
+
+_executor = ThreadPoolExecutor(max_workers=STAGE_POOL_SIZE, thread_name_prefix="search-stage")
+
+
+class StageTimeout(Exception):
+    """Raised when the stages of a request do not finish before its deadline"""
+
+
+def deadline_in(seconds: float = None) -> float:
+    return time.monotonic() + (SEARCH_TIMEOUT_SECONDS if seconds is None else seconds)
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn on the shared stage pool (in a copy of the caller's context) and return its Future"""
+    return _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def run_stages(stages: dict, deadline: float, cancel_when: dict = None) -> dict:
+    """
+    Run {name: callable} concurrently and return {name: result}.
+
+    cancel_when maps a stage name to (predicate, stage_names | ALL_STAGES): once
+    that stage finishes and predicate(result) is true, the listed stages are
+    cancelled and no longer waited for (their names are missing from the result).
+    The first stage exception cancels everything else and is re-raised.
+    """
+    cancel_when = cancel_when or {}
+    futures = {submit(fn): name for name, fn in stages.items()}
+    by_name = {name: f for f, name in futures.items()}
+    pending = set(futures)
+    results = {}
+
+    def _cancel(names):
+        for name in names:
+            f = by_name.get(name)
+            if f in pending:
+                f.cancel()
+                pending.discard(f)
+
+    while pending:
+        remaining = deadline - time.monotonic()
+        done, _ = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+        if not done:
+            _cancel(list(by_name))
+            raise StageTimeout(
+                f"Stages {sorted(futures[f] for f in futures if not f.done())} exceeded the deadline"
+            )
+
+        for f in done:
+            pending.discard(f)
+            name = futures[f]
+            try:
+                results[name] = f.result()
+            except Exception:
+                _cancel(list(by_name))
+                raise
+
+            rule = cancel_when.get(name)
+            if rule and rule[0](results[name]):
+                _cancel(list(by_name) if rule[1] == ALL_STAGES else rule[1])
+
+    return results
@@ -0,0 +1,58 @@
+# test_chapter_catalog.py
+import pytest
+
+import chapter_catalog
+
+
+class FakeIndex:
+    def __init__(self, matches):
+        self.matches = matches
+        self.queries = 0
+
+    def query(self, **kwargs):
+        self.queries += 1
+        return {"matches": self.matches}
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    """Catalog entry for chapter "gate" (set per test) and one fake index"""
+    entry = {}
+    index = FakeIndex([])
+    monkeypatch.setattr(chapter_catalog, "get_chapter_entry", lambda chapter_id: entry or None)
+    monkeypatch.setattr(chapter_catalog, "get_index", lambda name, host: index)
+    chapter_catalog._probes.clear()
+    yield entry, index
+    chapter_catalog._probes.clear()
+
+
+def test_positive_count_is_trusted(catalog):
+    entry, index = catalog
+    entry["indexes"] = {"vid": {"count": 3}}
+    assert chapter_catalog.chapter_has_records("gate", "vid", "h-vid")
+    assert index.queries == 0
+
+
+def test_zero_count_is_confirmed_by_a_cached_probe(catalog):
+    entry, index = catalog
+    entry["indexes"] = {"vid": {"count": 0}}
+    # Media added without the CLI: the catalog still says 0
+    index.matches = [{"id": "gate::v1"}]
+    assert chapter_catalog.chapter_has_records("gate", "vid", "h-vid")
+    assert chapter_catalog.chapter_has_records("gate", "vid", "h-vid")
+    assert index.queries == 1
+
+
+def test_empty_index_stays_skipped(catalog):
+    entry, index = catalog
+    entry["indexes"] = {"aud": {"count": 0}}
+    assert not chapter_catalog.chapter_has_records("gate", "aud", "h-aud")
+    assert not chapter_catalog.chapter_has_records("gate", "aud", "h-aud")
+    assert index.queries == 1
+
+
+def test_uncatalogued_chapter_is_probed(catalog):
+    _, index = catalog
+    index.matches = [{"id": "gate::0"}]
+    assert chapter_catalog.chapter_has_records("gate", "img", "h-img")
+    assert index.queries == 1
@@ -0,0 +1,42 @@
+# test_chapter_snapshot.py
+import numpy as np
+import pytest
+
+import chapter_snapshot
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(chapter_snapshot, "CHAPTER_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(chapter_snapshot, "CHAPTER_SNAPSHOT_FROM_STORAGE", False)
+    return tmp_path
+
+
+def test_round_trip(snapshot_dir):
+    records = [
+        {"id": "gate::0", "values": [3.0, 4.0], "metadata": {"image_url": "https://x/0"}},
+        {"id": "gate::1", "values": [0.0, 2.0], "metadata": {"caption": "इंडिया गेट"}},
+    ]
+    chapter_snapshot.write_snapshot("img", "india gate", records, dtype="float16", catalog_version=3)
+
+    snapshot = chapter_snapshot.open_snapshot("img", "india gate")
+    assert snapshot.ids == ["gate::0", "gate::1"]
+    assert snapshot.catalog_version == 3
+    np.testing.assert_allclose(snapshot.vectors, [[0.6, 0.8], [0.0, 1.0]], atol=1e-3)
+    assert snapshot.metadata[1] == {"caption": "इंडिया गेट"}
+    assert len(snapshot.metadata) == 2
+
+
+def test_chapter_without_records(snapshot_dir):
+    paths = chapter_snapshot.write_snapshot("aud", "gate", [], catalog_version=5)
+    assert len(paths) == 3
+
+    snapshot = chapter_snapshot.open_snapshot("aud", "gate")
+    assert snapshot.ids == []
+    assert snapshot.vectors.shape[0] == 0
+    assert len(snapshot.metadata) == 0
+    assert snapshot.catalog_version == 5
+
+
+def test_missing_snapshot(snapshot_dir):
+    assert chapter_snapshot.open_snapshot("img", "nowhere") is None
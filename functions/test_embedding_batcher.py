@@ -0,0 +1,98 @@
+# test_embedding_batcher.py
+import threading
+from types import SimpleNamespace
+import pytest
+
+import embedding_batcher
+
+
+class FakeEmbeddings:
+    """client.embeddings stand-in; the vector of a text is [len(text), call number]"""
+
+    def __init__(self, error=None):
+        self.inputs = []
+        self.error = error
+        self.lock = threading.Lock()
+
+    def create(self, model, input):
+        with self.lock:
+            self.inputs.append(input)
+            call = len(self.inputs)
+        if self.error:
+            raise self.error
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(t)), float(call)]) for i, t in enumerate(texts)
+        ])
+
+
+def _client(error=None):
+    return SimpleNamespace(embeddings=FakeEmbeddings(error))
+
+
+def _embed_concurrently(texts, client):
+    results, errors = [None] * len(texts), [None] * len(texts)
+
+    def worker(i):
+        try:
+            results[i] = embedding_batcher.embed(texts[i], client, "model")
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    """A wait long enough for every thread of a test to join the first batch"""
+    monkeypatch.setattr(embedding_batcher, "EMBED_BATCH_MAX_WAIT_MS", 200)
+    monkeypatch.setattr(embedding_batcher, "EMBED_BATCH_MAX_SIZE", 64)
+
+
+def test_concurrent_texts_share_one_call(batching):
+    client = _client()
+    results, errors = _embed_concurrently(["a", "bb", "ccc", "bb"], client)
+
+    assert errors == [None] * 4
+    assert len(client.embeddings.inputs) == 1
+    assert sorted(client.embeddings.inputs[0]) == ["a", "bb", "ccc"]
+    assert [r[0] for r in results] == [1.0, 2.0, 3.0, 2.0]
+    # Identical texts get their own copies
+    assert results[1] == results[3] and results[1] is not results[3]
+
+
+def test_full_batch_is_sent_without_waiting(monkeypatch):
+    monkeypatch.setattr(embedding_batcher, "EMBED_BATCH_MAX_WAIT_MS", 60000)
+    monkeypatch.setattr(embedding_batcher, "EMBED_BATCH_MAX_SIZE", 2)
+    client = _client()
+    results, errors = _embed_concurrently(["a", "bb"], client)
+    assert errors == [None, None]
+    assert sorted(r[0] for r in results) == [1.0, 2.0]
+
+
+def test_lone_text_is_sent_after_the_wait(monkeypatch):
+    monkeypatch.setattr(embedding_batcher, "EMBED_BATCH_MAX_WAIT_MS", 1)
+    client = _client()
+    assert embedding_batcher.embed("solo", client, "model") == [4.0, 1.0]
+    assert client.embeddings.inputs == [["solo"]]
+
+
+def test_errors_reach_every_caller(batching):
+    client = _client(error=ValueError("bad input"))
+    results, errors = _embed_concurrently(["a", "b"], client)
+    assert results == [None, None]
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert len(client.embeddings.inputs) == 1
+
+
+def test_disabled_sends_each_text(monkeypatch):
+    monkeypatch.setattr(embedding_batcher, "EMBED_BATCH_MAX_WAIT_MS", 0)
+    client = _client()
+    assert embedding_batcher.embed("x", client, "model") == [1.0, 1.0]
+    assert embedding_batcher.embed("yy", client, "model") == [2.0, 2.0]
+    assert client.embeddings.inputs == ["x", "yy"]
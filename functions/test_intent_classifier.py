@@ -0,0 +1,39 @@
+# test_intent_classifier.py
+import pytest
+
+from intent_classifier import classify_all, classify_locally, rule_scores, INTENT_LABELS
+
+
+@pytest.mark.parametrize("text, intents", [
+    ("show me a photo and play the audio story", ["search_image", "search_audio"]),
+    ("play the video & show some pictures", ["search_video", "search_image"]),
+    ("India Gate ki photo aur video bhi dikhao", ["search_image", "search_video"]),
+    ("इसकी फोटो और वीडियो दिखाओ", ["search_image", "search_video"]),
+    ("a clip of the parade as well as the narration", ["search_video", "search_audio"]),
+])
+def test_compound_requests(text, intents):
+    assert classify_all(text) == (intents, None)
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("video of the audio guide, please", None),
+    ("Qutub Minar ki photo bhi dikhao", "search_image"),
+    ("photos of India Gate and Qutub Minar", "search_image"),
+    ("videos and more video clips", "search_video"),
+    ("photo, video", None),
+])
+def test_single_requests(text, intent):
+    intents, _ = classify_all(text)
+    assert intents == ([intent] if intent else None)
+
+
+def test_generate_outranks_media_nouns():
+    assert classify_all("draw an image of the gate and a photo of the fort") == (["generate_image"], None)
+
+
+def test_cue_scores_rank_intents():
+    scores = rule_scores("who built this monument and when")
+    assert set(scores) == set(INTENT_LABELS)
+    assert sum(scores.values()) == pytest.approx(1.0)
+    assert max(scores, key=scores.get) == "web_search"
+    assert classify_locally("who built this monument and when") == "web_search"
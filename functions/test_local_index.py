@@ -0,0 +1,51 @@
+# test_local_index.py
+import pytest
+
+import local_index
+
+
+@pytest.fixture
+def listing(monkeypatch):
+    """Chapter "gate" pinned to the local engine, listed from a fake Pinecone index"""
+    records = {}
+    calls = []
+
+    def list_chapter_records(index_name, index_host, chapter_id):
+        calls.append((index_name, chapter_id))
+        return records.get(index_name, [])
+
+    monkeypatch.setattr(local_index, "get_chapter_entry", lambda chapter_id: {"searchEngine": "local", "version": 1})
+    monkeypatch.setattr(local_index, "list_chapter_records", list_chapter_records)
+    monkeypatch.setattr(local_index.chapter_snapshot, "open_snapshot", lambda index_name, chapter_id: None)
+    monkeypatch.setattr(local_index.record_metadata, "remember", lambda index_name, metadata: None)
+    local_index._matrices.clear()
+    yield records, calls
+    local_index._matrices.clear()
+
+
+def test_query_ranks_by_cosine(listing):
+    records, _ = listing
+    records["img"] = [
+        {"id": "gate::0", "values": [1.0, 0.0], "metadata": {"n": 0}},
+        {"id": "gate::1", "values": [0.6, 0.8], "metadata": {"n": 1}},
+        {"id": "gate::2", "values": [0.0, 3.0], "metadata": {"n": 2}},
+    ]
+    matches = local_index.query("img", "h-img", "gate", [0.0, 1.0], top_k=2)
+    assert [m["id"] for m in matches] == ["gate::2", "gate::1"]
+    assert matches[0]["score"] == pytest.approx(1.0)
+    assert matches[1]["metadata"] == {"n": 1}
+
+
+def test_chapter_without_records_is_loaded_once(listing):
+    _, calls = listing
+    assert local_index.query("aud", "h-aud", "gate", [1.0, 0.0]) == []
+    assert local_index.query("aud", "h-aud", "gate", [0.0, 1.0]) == []
+    assert calls == [("aud", "gate")]
+
+
+def test_unpinned_chapter_stays_on_pinecone(listing, monkeypatch):
+    _, calls = listing
+    monkeypatch.setattr(local_index, "get_chapter_entry", lambda chapter_id: {"version": 1})
+    monkeypatch.setattr(local_index, "LOCAL_SEARCH_CHAPTERS", set())
+    assert local_index.query("img", "h-img", "gate", [1.0, 0.0]) is None
+    assert calls == []
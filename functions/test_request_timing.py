@@ -0,0 +1,49 @@
+# test_request_timing.py
+import json
+from types import SimpleNamespace
+
+import request_timing
+from request_timing import stage, timed_request, register_stats
+
+
+def _log_lines(capsys, event):
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    return [line for line in lines if line.get("event") == event]
+
+
+def test_stages_are_timed_and_logged(capsys):
+    @timed_request("test_function")
+    def handler():
+        with stage("embed"):
+            pass
+        with stage("embed"):
+            pass
+        return SimpleNamespace(status_code=200, headers={})
+
+    response = handler()
+    assert response.headers["Server-Timing"].startswith("embed;dur=")
+    [line] = _log_lines(capsys, "request_timing")
+    assert line["function"] == "test_function"
+    assert line["stages"]["embed"]["count"] == 2
+
+
+def test_stage_outside_a_request_is_a_no_op():
+    with stage("pinecone"):
+        pass
+
+
+def test_instance_stats_are_logged_periodically(capsys, monkeypatch):
+    monkeypatch.setattr(request_timing, "REQUEST_STATS_LOG_EVERY", 3)
+    monkeypatch.setattr(request_timing, "_requests", 0)
+    monkeypatch.setattr(request_timing, "_stats_providers", {})
+    register_stats("good", lambda: {"hits": 1})
+    register_stats("broken", lambda: 1 / 0)
+
+    handler = timed_request("test_function")(lambda: SimpleNamespace(status_code=200, headers={}))
+    for _ in range(7):
+        handler()
+
+    lines = _log_lines(capsys, "instance_stats")
+    assert [line["requests"] for line in lines] == [3, 6]
+    assert lines[0]["stats"]["good"] == {"hits": 1}
+    assert "error" in lines[0]["stats"]["broken"]
@@ -0,0 +1,149 @@
+# test_resilience.py
+import time
+import threading
+import itertools
+import pytest
+
+import resilience
+from resilience import DependencyTimeout, DependencyUnavailable
+
+_names = itertools.count()
+
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+@pytest.fixture
+def dependency(monkeypatch):
+    """A fresh dependency name with a fast breaker"""
+    monkeypatch.setattr(resilience, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(resilience, "BREAKER_OPEN_SECONDS", 0.05)
+    return f"test_dependency_{next(_names)}"
+
+
+def _fail(name, error, times):
+    def fn():
+        raise error
+
+    for _ in range(times):
+        with pytest.raises(type(error)):
+            resilience.call(name, fn)
+
+
+def _stats(name):
+    return resilience.resilience_stats()[name]
+
+
+def test_breaker_opens_after_consecutive_outages(dependency):
+    _fail(dependency, ConnectionError("down"), 3)
+    assert _stats(dependency)["circuit"] == "open"
+
+    calls = []
+    with pytest.raises(DependencyUnavailable):
+        resilience.call(dependency, lambda: calls.append(1))
+    assert calls == []
+    assert _stats(dependency)["short_circuited"] == 1
+
+
+def test_half_open_lets_one_trial_through(dependency):
+    _fail(dependency, StatusError(503), 3)
+    time.sleep(0.06)
+
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def trial():
+        started.set()
+        release.wait(5)
+        return "ok"
+
+    thread = threading.Thread(target=lambda: results.append(resilience.call(dependency, trial)))
+    thread.start()
+    assert started.wait(5)
+    # Only the trial is let through while it runs
+    with pytest.raises(DependencyUnavailable):
+        resilience.call(dependency, lambda: "second")
+    release.set()
+    thread.join()
+
+    assert results == ["ok"]
+    assert _stats(dependency)["circuit"] == "closed"
+    assert resilience.call(dependency, lambda: "after") == "after"
+
+
+def test_failed_trial_reopens(dependency):
+    _fail(dependency, StatusError(429), 3)
+    time.sleep(0.06)
+    _fail(dependency, TimeoutError("slow"), 1)
+    with pytest.raises(DependencyUnavailable):
+        resilience.call(dependency, lambda: "blocked")
+
+
+def test_client_errors_do_not_count(dependency):
+    _fail(dependency, StatusError(400), 5)
+    _fail(dependency, ValueError("bad filter"), 5)
+    stats = _stats(dependency)
+    assert stats["circuit"] == "closed"
+    assert stats["client_errors"] == 10
+    assert stats["failures"] == 0
+
+
+def test_client_error_resets_the_count(dependency):
+    _fail(dependency, ConnectionError("down"), 2)
+    _fail(dependency, StatusError(404), 1)
+    _fail(dependency, ConnectionError("down"), 2)
+    assert _stats(dependency)["circuit"] == "closed"
+
+
+@pytest.mark.parametrize("error, outage", [
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (StatusError(429), True),
+    (StatusError(500), True),
+    (StatusError(400), False),
+    (StatusError(404), False),
+    (ValueError(), False),
+    (type("APIConnectionError", (Exception,), {})(), True),
+])
+def test_is_outage(error, outage):
+    assert resilience.is_outage(error) is outage
+
+
+def test_deadline(dependency, monkeypatch):
+    monkeypatch.setitem(resilience.DEPENDENCY_DEADLINES, dependency, 0.05)
+    release = threading.Event()
+    with pytest.raises(DependencyTimeout):
+        resilience.call(dependency, lambda: release.wait(5))
+    release.set()
+    assert _stats(dependency)["timeouts"] == 1
+
+
+def test_slow_attempt_is_hedged(dependency, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGED_DEPENDENCIES", {dependency})
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY_MS", 1)
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        resilience.call(dependency, lambda: "fast")
+
+    attempts = itertools.count(1)
+    release = threading.Event()
+
+    def first_attempt_hangs():
+        if next(attempts) == 1:
+            release.wait(5)
+            return "first"
+        return "hedge"
+
+    assert resilience.call(dependency, first_attempt_hangs) == "hedge"
+    release.set()
+    stats = _stats(dependency)
+    assert (stats["hedges_fired"], stats["hedges_won"]) == (1, 1)
+
+
+def test_unhedged_dependency_waits_for_its_attempt(dependency):
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        resilience.call(dependency, lambda: None)
+    assert resilience.call(dependency, lambda: time.sleep(0.02) or "only") == "only"
+    assert _stats(dependency)["hedges_fired"] == 0
@@ -0,0 +1,38 @@
+# test_result_cursor.py
+import pytest
+
+from result_cursor import is_follow_up
+
+
+@pytest.mark.parametrize("text", [
+    "another one",
+    "show me the next video please",
+    "one more photo",
+    "ek aur",
+    "aur ek photo dikhao",
+    "aur dikhao",
+    "next dikhao",
+    "doosri wali dikhao please",
+    "dusra video bhejo",
+    "एक और",
+    "और दिखाओ",
+    "दूसरी फोटो दिखाओ",
+])
+def test_follow_ups(text):
+    assert is_follow_up(text)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "aur",
+    "next time show me the fort",
+    "aur ek baat batao Qutub Minar ke baare mein",
+    "doosri jagah ki photo dikhao",
+    "aur India Gate ka video",
+    "Qutub Minar ki photo dikhao",
+    "और एक बात बताओ",
+    "दूसरी जगह की फोटो दिखाओ",
+    "another " + "very " * 20 + "long request",
+])
+def test_new_requests(text):
+    assert not is_follow_up(text)
@@ -0,0 +1,74 @@
+# test_singleflight.py
+import time
+import threading
+
+import singleflight
+
+
+def _run_concurrently(n, fn):
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def _wait_for_followers(shared_before, followers):
+    deadline = time.monotonic() + 5
+    while singleflight.singleflight_stats()["shared"] - shared_before < followers:
+        assert time.monotonic() < deadline, "followers never joined the running call"
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    shared_before = singleflight.singleflight_stats()["shared"]
+    calls = []
+
+    def slow():
+        calls.append(1)
+        _wait_for_followers(shared_before, 4)
+        return {"value": 42}
+
+    threads, results, errors = _run_concurrently(5, lambda: singleflight.do("same-key", slow))
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 5
+    assert errors == [None] * 5
+    assert singleflight.singleflight_stats()["in_flight"] == 0
+
+
+def test_exception_is_shared_and_not_kept():
+    shared_before = singleflight.singleflight_stats()["shared"]
+
+    def failing():
+        _wait_for_followers(shared_before, 2)
+        raise ValueError("boom")
+
+    threads, results, errors = _run_concurrently(3, lambda: singleflight.do("failing-key", failing))
+    for t in threads:
+        t.join()
+
+    assert all(isinstance(e, ValueError) for e in errors)
+    # Nothing is kept once the call has ended
+    assert singleflight.do("failing-key", lambda: "fresh") == "fresh"
+
+
+def test_different_keys_run_separately():
+    assert singleflight.do("a", lambda: 1) == 1
+    assert singleflight.do("b", lambda: 2) == 2
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_ENABLED", False)
+    before = singleflight.singleflight_stats()["calls"]
+    assert singleflight.do("k", lambda: "direct") == "direct"
+    assert singleflight.singleflight_stats()["calls"] == before
@@ -0,0 +1,64 @@
+# test_ttl_cache.py
+import pytest
+
+import ttl_cache
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_set_and_stats(clock):
+    cache = TTLCache(maxsize=4, ttl=10, name="t")
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b", "default") == "default"
+    stats = cache.stats()
+    assert (stats["name"], stats["size"], stats["hits"], stats["misses"]) == ("t", 1, 1, 2)
+
+
+def test_entries_expire(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    clock[0] += 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_max_bytes(clock):
+    cache = TTLCache(maxsize=100, max_bytes=10, sizeof=len)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+    cache.set("b", "z")
+    assert cache.stats()["bytes"] == 1
+
+
+def test_pop_and_clear(clock):
+    cache = TTLCache(max_bytes=100, sizeof=len)
+    cache.set("a", "abc")
+    assert cache.pop("a") == "abc"
+    assert cache.pop("a", "gone") == "gone"
+    cache.set("b", "de")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0